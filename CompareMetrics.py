@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import os
 import sys
@@ -22,96 +24,49 @@ scenarios = ["baseline", "loss2", "loss5", "delay100"]
 # -----------------------------
 #  Load summaries
 # -----------------------------
-summary_dfs = []
+summary_paths = []
 for scenario in scenarios:
     path = os.path.join(RUN_DIR, scenario, "results", "summary.csv")
     if not os.path.exists(path):
         print(f"[WARNING] Summary file not found: {path}")
         continue
-    df = pd.read_csv(path)
-    df["scenario"] = scenario
-    summary_dfs.append(df)
+    summary_paths.append((scenario, path))
 
-if not summary_dfs:
+if not summary_paths:
     print("[ERROR] No summary files loaded. Exiting.")
     sys.exit(1)
 
-summary_all = pd.concat(summary_dfs, ignore_index=True)
-
-# -----------------------------
-#  1. Mean Latency
-# -----------------------------
-plt.figure(figsize=(6,4))
-plt.bar(summary_all["scenario"], summary_all["Mean Latency (ms)"])
-plt.title("Mean Latency per Scenario")
-plt.xlabel("Scenario")
-plt.ylabel("Latency (ms)")
-plt.grid(True, axis='y')
-plt.savefig(os.path.join(plots_dir, "compare_mean_latency.png"))
-
-# -----------------------------
-#  2. Mean Jitter
-# -----------------------------
-plt.figure(figsize=(6,4))
-plt.bar(summary_all["scenario"], summary_all["Mean Jitter (ms)"])
-plt.title("Mean Jitter per Scenario")
-plt.xlabel("Scenario")
-plt.ylabel("Jitter (ms)")
-plt.grid(True, axis='y')
-plt.savefig(os.path.join(plots_dir, "compare_mean_jitter.png"))
-
-# -----------------------------
-#  3. Mean Error
-# -----------------------------
-plt.figure(figsize=(6,4))
-plt.bar(summary_all["scenario"], summary_all["Mean Error"])
-plt.title("Mean Position Error per Scenario")
-plt.xlabel("Scenario")
-plt.ylabel("Error")
-plt.grid(True, axis='y')
-plt.savefig(os.path.join(plots_dir, "compare_mean_error.png"))
-
-# -----------------------------
-#  4. Avg CPU%
-# -----------------------------
-plt.figure(figsize=(6,4))
-plt.bar(summary_all["scenario"], summary_all["Avg CPU% (server only)"])
-plt.title("Avg CPU Usage per Scenario")
-plt.xlabel("Scenario")
-plt.ylabel("CPU (%)")
-plt.grid(True, axis='y')
-plt.savefig(os.path.join(plots_dir, "compare_avg_cpu.png"))
-
-# -----------------------------
-#  5. Bandwidth vs Updates
-# -----------------------------
-plt.figure(figsize=(6,4))
-plt.scatter(summary_all["Avg Updates/sec"], summary_all["Avg Bandwidth (kbps per client)"])
-
-for idx, row in summary_all.iterrows():
-    plt.text(row["Avg Updates/sec"], row["Avg Bandwidth (kbps per client)"], row["scenario"],
-             fontsize=9, ha='right', va='bottom')
-
-plt.title("Bandwidth vs Updates per Scenario")
-plt.xlabel("Avg Updates/sec")
-plt.ylabel("Avg Bandwidth (kbps per client)")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "compare_bandwidth_vs_updates.png"))
-
-# -----------------------------
-#  6. Bandwidth vs Loss
-# -----------------------------
-plt.figure(figsize=(6,4))
-plt.scatter(summary_all["Avg Loss (%)"], summary_all["Avg Bandwidth (kbps per client)"])
-
-for idx, row in summary_all.iterrows():
-    plt.text(row["Avg Loss (%)"], row["Avg Bandwidth (kbps per client)"], row["scenario"],
-             fontsize=9, ha='right', va='bottom')
-
-plt.title("Bandwidth vs Loss per Scenario")
-plt.xlabel("Avg Loss (%)")
-plt.ylabel("Avg Bandwidth (kbps per client)")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "compare_bandwidth_vs_loss.png"))
+summary_all = pd.concat([pd.read_csv(p).assign(scenario=s) for s, p in summary_paths], ignore_index=True)
+
+# -----------------------------
+#  Plot specs
+# -----------------------------
+# (kind, x column, y column, title, xlabel, ylabel, filename)
+plot_specs = [
+    ("bar", "scenario", "Mean Latency (ms)", "Mean Latency per Scenario", "Scenario", "Latency (ms)", "compare_mean_latency.png"),
+    ("bar", "scenario", "Mean Jitter (ms)", "Mean Jitter per Scenario", "Scenario", "Jitter (ms)", "compare_mean_jitter.png"),
+    ("bar", "scenario", "Mean Error", "Mean Position Error per Scenario", "Scenario", "Error", "compare_mean_error.png"),
+    ("bar", "scenario", "Avg CPU% (server only)", "Avg CPU Usage per Scenario", "Scenario", "CPU (%)", "compare_avg_cpu.png"),
+    ("scatter", "Avg Updates/sec", "Avg Bandwidth (kbps per client)", "Bandwidth vs Updates per Scenario",
+     "Avg Updates/sec", "Avg Bandwidth (kbps per client)", "compare_bandwidth_vs_updates.png"),
+    ("scatter", "Avg Loss (%)", "Avg Bandwidth (kbps per client)", "Bandwidth vs Loss per Scenario",
+     "Avg Loss (%)", "Avg Bandwidth (kbps per client)", "compare_bandwidth_vs_loss.png"),
+]
+
+for kind, xcol, ycol, title, xlabel, ylabel, fname in plot_specs:
+    fig, ax = plt.subplots(figsize=(6,4))
+    if kind == "bar":
+        ax.bar(summary_all[xcol], summary_all[ycol])
+        ax.grid(True, axis='y')
+    else:
+        ax.scatter(summary_all[xcol], summary_all[ycol])
+        for x, y, label in zip(summary_all[xcol], summary_all[ycol], summary_all["scenario"]):
+            ax.text(x, y, label, fontsize=9, ha='right', va='bottom')
+        ax.grid(True)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    fig.savefig(os.path.join(plots_dir, fname))
+    plt.close(fig)
 
 print("[DONE] All comparison plots saved in", plots_dir)
@@ -1,7 +1,13 @@
-import struct, time, zlib, csv, psutil, logging, os
-from collections import defaultdict, deque
+import struct, time, csv, psutil, logging, os, socket, threading
+from collections import defaultdict, deque, OrderedDict
+from itertools import islice
 from dataclasses import dataclass, field
-from typing import Dict, Tuple, List, Deque
+from typing import Dict, Tuple, List, Deque, NamedTuple
+
+try:
+    from zlib_ng.zlib_ng import crc32  # optional SIMD CRC32; same polynomial and output as zlib.crc32
+except ImportError:
+    from zlib import crc32
 
 
 # ====== Game Config ======
@@ -14,6 +20,12 @@ TOTAL_CELLS = GRID_N * GRID_N
 # ESP Header: protocol_id (4s -> 4-byte string), version (B -> unsigned char 1 byte), msg_type (B -> unsigned char 1 byte), snapshot_id (I -> unsigned int 4 bytes), seq_num (I -> unsigned int 4 bytes), timestamp (server, client) (Q -> unsigned long long 8 bytes), payload_len (H -> unsigned short 2 bytes), pkt_id (I -> unsigned int 4 bytes), checksum (I -> unsigned int 4 bytes)
 HEADER_FMT = "!4s B B I I Q H I I" # !-> Network (big-endian)
 HEADER_SIZE = struct.calcsize(HEADER_FMT) # should be 32 bytes
+HEADER_STRUCT = struct.Struct(HEADER_FMT)
+# checksum is the trailing header field, patched in place once the CRC is known
+CHECKSUM_FMT = "!I"
+CHECKSUM_STRUCT = struct.Struct(CHECKSUM_FMT)
+CHECKSUM_OFFSET = HEADER_SIZE - CHECKSUM_STRUCT.size # should be 28 bytes
+ZERO_CHECKSUM = bytes(CHECKSUM_STRUCT.size)
 
 """  Payload Formats """
 # INIT Payload: empty
@@ -21,52 +33,65 @@ HEADER_SIZE = struct.calcsize(HEADER_FMT) # should be 32 bytes
 # INIT_ACK Payload: seq_num (I), player_id (I) 
 INIT_ACK_FMT = "!I I"
 INIT_ACK_SIZE = struct.calcsize(INIT_ACK_FMT)
+INIT_ACK_STRUCT = struct.Struct(INIT_ACK_FMT)
 
 # CREATE_ROOM Payload: room_name (variable length string, UTF-8)
 
 # CREATE_ACK Payload: seq_num (I), room_id (B)
 CREATE_ACK_FMT = "!I B"
 CREATE_ACK_SIZE = struct.calcsize(CREATE_ACK_FMT)
+CREATE_ACK_STRUCT = struct.Struct(CREATE_ACK_FMT)
 
 # JOIN_ROOM Payload: room_id (B)
 JOIN_ROOM_FMT = "!B"
 JOIN_ROOM_SIZE = struct.calcsize(JOIN_ROOM_FMT)
+JOIN_ROOM_STRUCT = struct.Struct(JOIN_ROOM_FMT)
 
 # JOIN_ACK Payload: seq_num (I), room_id (B), local_id (B), players_count (B), followed by room players (player_id (I), player_local_id (B), player_color (RED (B), GREEN (B), BLUE (B))*
 JOIN_ACK_HEADER_FMT = "!I B B B"
 JOIN_ACK_HEADER_SIZE = struct.calcsize(JOIN_ACK_HEADER_FMT)
+JOIN_ACK_HEADER_STRUCT = struct.Struct(JOIN_ACK_HEADER_FMT)
 JOIN_ACK_ENTRY_FMT = "!I B B B B"
 JOIN_ACK_ENTRY_SIZE = struct.calcsize(JOIN_ACK_ENTRY_FMT)
+JOIN_ACK_ENTRY_STRUCT = struct.Struct(JOIN_ACK_ENTRY_FMT)
 
 # LEAVE_ROOM payload: empty
 
 # LEAVE_ACK payload: seq_num (I), players_count (B), followed by room players (player_id (I), player_local_id (B), player_color (RED (B), GREEN (B), BLUE (B))*
 LEAVE_ACK_HEADER_FMT = "!I B"
 LEAVE_ACK_HEADER_SIZE = struct.calcsize(LEAVE_ACK_HEADER_FMT)
+LEAVE_ACK_HEADER_STRUCT = struct.Struct(LEAVE_ACK_HEADER_FMT)
 LEAVE_ACK_ENTRY_FMT = "!I B B B B"
 LEAVE_ACK_ENTRY_SIZE = struct.calcsize(LEAVE_ACK_ENTRY_FMT)
+LEAVE_ACK_ENTRY_STRUCT = struct.Struct(LEAVE_ACK_ENTRY_FMT)
 
 # LIST_ROOMS Payload: empty
 
 # LIST_ROOMS_ACK Payload: seq_num (I), room_count (B), followed by room entries (room_id (B), player_count (B), room_name_length (B), room_name (UTF-8 string))*
 LIST_ROOMS_ACK_HEADER_FMT = "!I B"
 LIST_ROOMS_ACK_HEADER_SIZE = struct.calcsize(LIST_ROOMS_ACK_HEADER_FMT)
+LIST_ROOMS_ACK_HEADER_STRUCT = struct.Struct(LIST_ROOMS_ACK_HEADER_FMT)
 LIST_ROOMS_ACK_ENTRY_FMT = "!B B B"
 LIST_ROOMS_ACK_ENTRY_SIZE = struct.calcsize(LIST_ROOMS_ACK_ENTRY_FMT)
+LIST_ROOMS_ACK_ENTRY_STRUCT = struct.Struct(LIST_ROOMS_ACK_ENTRY_FMT)
 
 # Event Payload: event_type (B), room_id (B), player_local_id (B), cell_idx (H)
 EVENT_FMT = "!B B B H"
 EVENT_SIZE = struct.calcsize(EVENT_FMT)
+EVENT_STRUCT = struct.Struct(EVENT_FMT)
 
 # Updates Payload: updates count (H), followed by events (event_type (B), player_local_id (B), cell_idx (H))
 UPDATES_HEADER_FMT = "!H"
 UPDATES_HEADER_SIZE = struct.calcsize(UPDATES_HEADER_FMT)
+UPDATES_HEADER_STRUCT = struct.Struct(UPDATES_HEADER_FMT)
 UPDATES_ENTRY_FMT = "!B B H"
 UPDATES_ENTRY_SIZE = struct.calcsize(UPDATES_ENTRY_FMT)
+UPDATES_ENTRY_STRUCT = struct.Struct(UPDATES_ENTRY_FMT)
 
-# Updates ACK Payload: seq_num (I)
+# Updates ACK Payload: seq_num (I) per acknowledged fragment; the count follows from the length
 UPDATES_ACK_FMT = "!I"
 UPDATES_ACK_SIZE = struct.calcsize(UPDATES_ACK_FMT)
+UPDATES_ACK_STRUCT = struct.Struct(UPDATES_ACK_FMT)
 
 # Snapshot Payload: grid state (TOTAL_CELLS bytes, each byte = owner player_id or 0)
 SNAPSHOT_FMT = "!%dB" % TOTAL_CELLS
@@ -75,6 +100,7 @@ SNAPSHOT_SIZE = struct.calcsize(SNAPSHOT_FMT)
 # Snapshot ACK Payload: seq_num (I)
 SNAPSHOT_ACK_FMT = "!I"
 SNAPSHOT_ACK_SIZE = struct.calcsize(SNAPSHOT_ACK_FMT)
+SNAPSHOT_ACK_STRUCT = struct.Struct(SNAPSHOT_ACK_FMT)
 
 """  Protocol Constants """
 PROTOCOL_ID = b'ESP1'
@@ -97,15 +123,38 @@ MESSAGE_TYPES = {
     'SNAPSHOT_ACK': 14,
     'DISCONNECT': 15,
 }
+# plain int aliases for the hot build/dispatch paths (no dict lookup per packet)
+MSG_INIT = MESSAGE_TYPES['INIT']
+MSG_INIT_ACK = MESSAGE_TYPES['INIT_ACK']
+MSG_CREATE_ROOM = MESSAGE_TYPES['CREATE_ROOM']
+MSG_CREATE_ACK = MESSAGE_TYPES['CREATE_ACK']
+MSG_JOIN_ROOM = MESSAGE_TYPES['JOIN_ROOM']
+MSG_JOIN_ACK = MESSAGE_TYPES['JOIN_ACK']
+MSG_LEAVE_ROOM = MESSAGE_TYPES['LEAVE_ROOM']
+MSG_LEAVE_ACK = MESSAGE_TYPES['LEAVE_ACK']
+MSG_LIST_ROOMS = MESSAGE_TYPES['LIST_ROOMS']
+MSG_LIST_ROOMS_ACK = MESSAGE_TYPES['LIST_ROOMS_ACK']
+MSG_EVENT = MESSAGE_TYPES['EVENT']
+MSG_UPDATES = MESSAGE_TYPES['UPDATES']
+MSG_UPDATES_ACK = MESSAGE_TYPES['UPDATES_ACK']
+MSG_SNAPSHOT = MESSAGE_TYPES['SNAPSHOT']
+MSG_SNAPSHOT_ACK = MESSAGE_TYPES['SNAPSHOT_ACK']
+MSG_DISCONNECT = MESSAGE_TYPES['DISCONNECT']
 
 EVENT_TYPES = {
     'CELL_ACQUISITION': 0,
 }
+EVT_CELL_ACQUISITION = EVENT_TYPES['CELL_ACQUISITION']
 MAX_PACKET = 1200 # bytes
+RECV_BUFSIZE = MAX_PACKET + 1 # one spare byte, so an oversized datagram reads as nbytes > MAX_PACKET and is dropped
+CLIENT_RECV_BATCH = 32 # datagrams the client handles per wake before returning to its loop
+SERVER_RECV_BATCH = 64 # datagrams the server handles per wake before running its tasks
+MAX_ROOM_NAME = 64 # bytes (UTF-8 encoded)
 SNAPSHOT_PAYLOAD_LIMIT = MAX_PACKET - HEADER_SIZE # bytes
 BROADCAST_FREQ_HZ = 20.7        # 20.7 snapshots/sec
 UPDATES_INTERVAL = 1.0 / BROADCAST_FREQ_HZ
 RETRANS_TIMEOUT = 0.1        # seconds
+RETRANS_TIMEOUT_NS = int(RETRANS_TIMEOUT * 1_000_000_000)  # same, against time.time_ns() stamps
 REDUNDANT_K_PACKETS = 3      # send K redundant packets
 REDUNDANT_K_UPDATES = 3      # include last K updates per packet
 LAST_K_UPDATES = 10          # max latest updates saved
@@ -123,7 +172,7 @@ class Room:
     name: str
     snapshot_id: int = 0
     players: Dict[int, RoomPlayer] = field(default_factory=dict)
-    grid: List[int] = field(default_factory=lambda: [0]*TOTAL_CELLS)  # 0 = free, else player_local_id
+    grid: bytearray = field(default_factory=lambda: bytearray(TOTAL_CELLS))  # 0 = free, else player_local_id (one byte per cell)
     updates: Deque[Tuple[int,int,int]] = field(default_factory=lambda: deque(maxlen=LAST_K_UPDATES)) # [(event_type, local_id, cell_idx)]
 
 @dataclass
@@ -132,55 +181,78 @@ class PlayerRoomInfo:
     room_id: int = 0 # 0 means not in any room yet
     player_local_id: int = 0 # 0 means not assigned yet
 
+@dataclass(slots=True)
+class UnackedPacket:
+    packet: bytes
+    last_sent: int  # time.time_ns() of the latest (re)send
+    msg_type: int
+    sent_count: int = 0  # retransmissions so far
+
 @dataclass
 class Fragment:
     frags: Dict[int, bytes] = field(default_factory=dict)  # seq_num -> bytes
+    min_seq: int = 1 << 32  # lowest seq_num received (seq is a 4-byte field)
+    max_seq: int = -1       # highest seq_num received
     received_bytes: int = 0
     expected_bytes: int = 0
-    timestamp: int = field(default_factory=lambda: int(time.time_ns()))
+    timestamp: float = field(default_factory=time.monotonic)  # last arrival, monotonic seconds
 
 class FragmentManager:
     def __init__(self, timeout=5.0):
-        self.fragments: Dict[Tuple[Tuple[int,int], int], Fragment] = {}  # ((ip, port), msg_id) -> Fragment
-        self.timeout = timeout * 1e9
+        # ((ip, port), msg_id) -> Fragment, ordered by last arrival so expiry only looks at the front
+        self.fragments: OrderedDict[Tuple[Tuple[int,int], int], Fragment] = OrderedDict()
+        self.timeout = timeout  # seconds
 
-    def add_fragment(self, client_address, msg_id, seq, payload_len, payload):
+    def add_fragment(self, client_address, msg_id, seq, payload_len, payload, now=None):
         key = (client_address, msg_id)
-        if key not in self.fragments:
-            self.fragments[key] = Fragment(expected_bytes=payload_len)
-
-        frag = self.fragments[key]
-
-        if seq in frag.frags:
-            return None
+        frag = self.fragments.get(key)
+        if frag is None:
+            if len(payload) >= payload_len:
+                # complete in a single fragment (every message today): nothing to buffer or join
+                return ((seq,), payload)
+            frag = self.fragments[key] = Fragment(expected_bytes=payload_len)
+        else:
+            if seq in frag.frags:
+                return None
+            self.fragments.move_to_end(key)
 
-        frag.frags[seq] = payload
+        frag.frags[seq] = bytes(payload)  # may be a view of a reused receive buffer
+        if seq < frag.min_seq:
+            frag.min_seq = seq
+        if seq > frag.max_seq:
+            frag.max_seq = seq
         frag.received_bytes += len(payload)
-        frag.timestamp = time.time_ns()
+        frag.timestamp = now if now is not None else time.monotonic()
 
         if frag.received_bytes >= frag.expected_bytes:
-            seq_keys = sorted(frag.frags)
-            if not all(seq_keys[i + 1] == seq_keys[i] + 1 for i in  range(len(seq_keys) - 1)):
+            # distinct seqs are contiguous iff they exactly fill [min_seq, max_seq]
+            if frag.max_seq - frag.min_seq + 1 != len(frag.frags):
                 return None
-            full_payload = b''.join(frag.frags[i] for i in seq_keys)
+            seq_keys = tuple(range(frag.min_seq, frag.max_seq + 1))
+            full_payload = memoryview(b''.join(frag.frags[i] for i in seq_keys))
             del self.fragments[key]
             return (seq_keys, full_payload)
         
         return None
 
     def cleanup(self):
-        now = time.time_ns()
-        expired = [key for key, frag in self.fragments.items()
-                   if now - frag.timestamp > self.timeout]
-        for key in expired:
-            del self.fragments[key]
+        now = time.monotonic()
+        while self.fragments:
+            frag = next(iter(self.fragments.values()))
+            if now - frag.timestamp <= self.timeout:
+                break
+            self.fragments.popitem(last=False)
+
+METRICS_FLUSH_ROWS = 100  # buffered rows that wake the writer thread early
+METRICS_FLUSH_INTERVAL = 1.0  # seconds between CPU samples / forced flushes
 
 class MetricsLogger:
     def __init__(self, filename="server_metrics.csv", server_mode=True):
         self.filename = filename
         self.server_mode = server_mode
         self.start_time = defaultdict(lambda: None)  # player_id -> start_time
-        self.last_recv_times = defaultdict(list)  # player_id -> [recv_times]
+        self.prev_recv: Dict[int, float] = {}  # player_id -> last recv_time
+        self.prev_diff: Dict[int, float] = {}  # player_id -> last inter-arrival time
         self.fieldnames = [
             "client_id", "snapshot_id", "seq_num",
             "server_timestamp_ms", "recv_time_ms",
@@ -199,8 +271,45 @@ class MetricsLogger:
         # Initialize CSV
         os.makedirs("results_raw", exist_ok=True)
         self.file = open(os.path.join("results_raw", filename), "w", newline="")
-        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames)
-        self.writer.writeheader()
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.fieldnames)
+
+        # Rows are buffered and written in batches by a writer thread; CPU is sampled there
+        # too, so log_snapshot never touches the file or psutil.
+        self.rows = []
+        self.lock = threading.Lock()  # guards self.rows
+        self.wake = threading.Event()  # set when a full batch is waiting
+        self.cpu_percent = psutil.cpu_percent(interval=None) if self.server_mode else 0.0
+        self.closed = False
+        self.writer_thread = threading.Thread(target=self.drain, name="metrics-writer", daemon=True)
+        self.writer_thread.start()
+
+    def drain(self):
+        next_sample = time.monotonic() + METRICS_FLUSH_INTERVAL
+        while not self.closed:
+            self.wake.wait(METRICS_FLUSH_INTERVAL)
+            self.wake.clear()
+            if self.server_mode and time.monotonic() >= next_sample:
+                self.cpu_percent = psutil.cpu_percent(interval=None)
+                next_sample = time.monotonic() + METRICS_FLUSH_INTERVAL
+            self.flush()
+
+    def flush(self):
+        # only the writer thread (or close, after joining it) writes to the file
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if self.file.closed:
+            return
+        if rows:
+            self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.writer_thread.join()
+        self.flush()
+        self.file.close()
     
     def positions_to_csv(self, positions):
         if not positions:
@@ -209,16 +318,6 @@ class MetricsLogger:
 
 
     def log_snapshot(self, client_id, snapshot_id, seq_num, server_time, positions, recv_time = None, bytes_received=None, loss=None):
-    
-        # Build row dictionary
-        row = {
-            "client_id": client_id,
-            "snapshot_id": snapshot_id,
-            "seq_num": seq_num,
-            "server_timestamp_ms": int(server_time / 1e6),
-            "positions": self.positions_to_csv(positions),
-        }
-        
         if  not self.server_mode:
             if bytes_received is None or recv_time is None:
                 return  # cannot compute client metrics without these
@@ -226,13 +325,13 @@ class MetricsLogger:
             # Client
             latency = recv_time - server_time
 
-            # Compute jitter
-            self.last_recv_times[client_id].append(recv_time)
-            recv_times = self.last_recv_times[client_id]
+            # Compute jitter from the last two inter-arrival times
             jitter = 0.0
-            if len(recv_times) > 1:
-                diffs = [recv_times[i] - recv_times[i - 1] for i in range(1, len(recv_times))]
-                jitter = abs(diffs[-1] - diffs[-2]) if len(diffs) > 1 else diffs[-1]
+            if client_id in self.prev_recv:
+                d = recv_time - self.prev_recv[client_id]
+                jitter = abs(d - self.prev_diff[client_id]) if client_id in self.prev_diff else d
+                self.prev_diff[client_id] = d
+            self.prev_recv[client_id] = recv_time
                 
             if client_id not in self.start_time:
                 self.start_time[client_id] = recv_time
@@ -240,119 +339,99 @@ class MetricsLogger:
             interval_s = max((recv_time - self.start_time[client_id]) / 1e9, 1e-6)
             bandwidth_per_client_kbps = (bytes_received * 8) / (interval_s * 1000)
             
-            row["recv_time_ms"] = int(recv_time / 1e6)
-            row["latency_ms"] = int(latency / 1e6)
-            row['jitter_ms'] = int(jitter / 1e6)
-            row["bandwidth_per_client_kbps"] = bandwidth_per_client_kbps
-            row["loss"] = loss if loss is not None else 0
+            row = (client_id, snapshot_id, seq_num, int(server_time / 1e6),
+                   int(recv_time / 1e6), int(latency / 1e6), int(jitter / 1e6),
+                   self.positions_to_csv(positions), bandwidth_per_client_kbps,
+                   loss if loss is not None else 0)
         else:
-            # Server: log CPU
-            cpu_percent = psutil.cpu_percent(interval=None)
-            row["cpu_percent"] = cpu_percent
+            # Server: log CPU (sampled by the timer)
+            row = (client_id, snapshot_id, seq_num, int(server_time / 1e6),
+                   self.positions_to_csv(positions), self.cpu_percent)
 
-        self.writer.writerow(row)
-        self.file.flush()
+        with self.lock:
+            self.rows.append(row)
+            full = len(self.rows) >= METRICS_FLUSH_ROWS
+        if full:
+            self.wake.set()
 
 
 
 """  Helper functions """
-def make_header(msg_type: int, pkt_id: int, seq_num: int, payload_len: int, timestamp: int = None, checksum: int = 0, snapshot_id: int = 0):
-    if timestamp is None:
-        timestamp = time.time_ns()
-    return struct.pack(HEADER_FMT, PROTOCOL_ID, VERSION, msg_type, snapshot_id, seq_num, timestamp, payload_len, pkt_id, checksum)
+def build_packet(msg_type: int, pkt_id: int, start_seq: int, payload: bytes, snapshot_id: int = 0, ts: int = None) -> list[bytearray]:
+    return write_fragments(msg_type, pkt_id, start_seq, memoryview(payload), snapshot_id, ts)
 
-def compute_checksum(header_bytes: bytes, payload: bytes) -> int:
-    return zlib.crc32(header_bytes + payload) & 0xFFFFFFFF
+def build_snapshot_packets(pkt_id: int, start_seq: int, grid: bytearray, snapshot_id: int = 0, ts: int = None) -> list[bytearray]:
+    # the grid is its own wire format (one byte per cell): fragments are copied straight out of it
+    return write_fragments(MSG_SNAPSHOT, pkt_id, start_seq, memoryview(grid), snapshot_id, ts)
 
-def build_packet(msg_type: int, pkt_id: int, start_seq: int, payload: bytes, snapshot_id: int = 0) -> list[bytes]:
+def write_fragments(msg_type: int, pkt_id: int, start_seq: int, data, snapshot_id: int = 0, ts: int = None) -> list[bytearray]:
     packets = []
     max_data = SNAPSHOT_PAYLOAD_LIMIT
+    # all fragments of one message share a single timestamp
+    if ts is None:
+        ts = time.time_ns()
 
     # even if payload empty, still make one control packet
-    if not payload:
-        ts = int(time.time_ns())
-        header = make_header(msg_type, pkt_id, start_seq, 0, timestamp=ts, checksum=0, snapshot_id=snapshot_id)
-        checksum = compute_checksum(header, b"")
-        header = struct.pack(
-            HEADER_FMT,
-            PROTOCOL_ID,
-            VERSION,
-            msg_type,
-            snapshot_id,
-            start_seq,
-            ts,
-            0,
-            pkt_id,
-            checksum,
-        )
-        return [header]
-
-    total_frags = (len(payload) + max_data - 1) // max_data
+    total_frags = max(1, (len(data) + max_data - 1) // max_data)
     seq_num = start_seq
 
     for frag_idx in range(total_frags):
         start = frag_idx * max_data
-        end = min(len(payload), start + max_data)
-        frag_data = payload[start:end]
-
-        ts = int(time.time_ns())
-        header = make_header(msg_type, pkt_id, seq_num, len(frag_data), timestamp=ts, checksum=0, snapshot_id=snapshot_id)
-        checksum = compute_checksum(header, frag_data)
-        header = struct.pack(
-            HEADER_FMT,
-            PROTOCOL_ID,
-            VERSION,
-            msg_type,
-            snapshot_id,
-            seq_num,
-            ts,
-            len(frag_data),
-            pkt_id,
-            checksum,
-        )
-
-        packets.append(header + frag_data)
+        end = min(len(data), start + max_data)
+        frag_len = end - start
+
+        # header and payload share one buffer; the checksum slot stays zero while the CRC is computed
+        buf = bytearray(HEADER_SIZE + frag_len)
+        buf[HEADER_SIZE:] = data[start:end]
+        HEADER_STRUCT.pack_into(buf, 0, PROTOCOL_ID, VERSION, msg_type, snapshot_id, seq_num, ts, frag_len, pkt_id, 0)
+        CHECKSUM_STRUCT.pack_into(buf, CHECKSUM_OFFSET, crc32(buf) & 0xFFFFFFFF)
+
+        packets.append(buf)
         seq_num += 1
 
     return packets
 
+class Packet(NamedTuple):
+    msg_type: int
+    pkt_id: int
+    seq: int
+    timestamp: int
+    payload_len: int
+    # view into the reused receive buffer, valid only until the next receive on it; bytes(payload) to keep it
+    payload: memoryview
+    snapshot_id: int
+    seq_keys: Tuple[int, ...] = ()  # seqs of every fragment, filled in once the message is reassembled
+
 def parse_packet(data: bytes):
     # verify minimum size
     if len(data) < HEADER_SIZE:
         return None
     
-    header = data[:HEADER_SIZE]
-    payload = data[HEADER_SIZE:]
-    protocol, version, msg_type, snapshot_id, seq_num, timestamp, payload_len, pkt_id, checksum = struct.unpack(HEADER_FMT, header)
+    protocol, version, msg_type, snapshot_id, seq_num, timestamp, payload_len, pkt_id, checksum = HEADER_STRUCT.unpack_from(data)
 
     # verify protocol and version
     if protocol != PROTOCOL_ID or version != VERSION:
         return None
     
-    # verify checksum
-    header_zero = struct.pack(HEADER_FMT, protocol, version, msg_type, snapshot_id, seq_num, timestamp, payload_len, pkt_id, 0)
-    calc = compute_checksum(header_zero, payload)
+    # verify checksum (computed as if the checksum field were zero)
+    view = memoryview(data)
+    payload = view[HEADER_SIZE:]  # a view even when data is bytes, so the payload is never copied here
+    calc = crc32(view[:CHECKSUM_OFFSET])
+    calc = crc32(ZERO_CHECKSUM, calc)
+    calc = crc32(payload, calc) & 0xFFFFFFFF
     if calc != checksum:
         return None
 
     # all checks passed
-    return {
-        'msg_type': msg_type,
-        'pkt_id': pkt_id,
-        'seq': seq_num,
-        'timestamp': timestamp,
-        'payload_len': payload_len,
-        'payload': payload,
-        'snapshot_id': snapshot_id
-    }
+    return Packet(msg_type, pkt_id, seq_num, timestamp, payload_len, payload, snapshot_id)
 
 def build_init_ack_payload(seq_num: int, player_id: int):
-    return struct.pack(INIT_ACK_FMT, seq_num, player_id)
+    return INIT_ACK_STRUCT.pack(seq_num, player_id)
 
 def parse_init_ack_payload(payload: bytes):
     if len(payload) < INIT_ACK_SIZE:
         return None
-    (seq_num, player_id) = struct.unpack(INIT_ACK_FMT, payload[:INIT_ACK_SIZE])
+    (seq_num, player_id) = INIT_ACK_STRUCT.unpack_from(payload)
     return (seq_num, player_id)
 
 def build_create_room_payload(room_name: str):
@@ -360,100 +439,116 @@ def build_create_room_payload(room_name: str):
     return name_bytes
 
 def parse_create_room_payload(payload: bytes):
-    room_name = payload.decode('utf-8')
+    # bound the work before decoding; malformed names are dropped instead of raising in the recv loop
+    if len(payload) > MAX_ROOM_NAME:
+        return None
+    try:
+        room_name = str(payload, "utf-8")
+    except UnicodeDecodeError:
+        return None
     return room_name
 
 def build_create_ack_payload(seq_num: int, room_id: int):
-    return struct.pack(CREATE_ACK_FMT, seq_num, room_id)
+    return CREATE_ACK_STRUCT.pack(seq_num, room_id)
 
 def parse_create_ack_payload(payload: bytes):
     if len(payload) < CREATE_ACK_SIZE:
         return None
-    (seq_num, room_id) = struct.unpack(CREATE_ACK_FMT, payload[:CREATE_ACK_SIZE])
+    (seq_num, room_id) = CREATE_ACK_STRUCT.unpack_from(payload)
     return (seq_num, room_id)
 
 def build_join_room_payload(room_id: int):
-    return struct.pack(JOIN_ROOM_FMT, room_id)
+    return JOIN_ROOM_STRUCT.pack(room_id)
 
 def parse_join_room_payload(payload: bytes):
     if len(payload) < JOIN_ROOM_SIZE:
         return None
-    (room_id,) = struct.unpack(JOIN_ROOM_FMT, payload[:JOIN_ROOM_SIZE])
+    (room_id,) = JOIN_ROOM_STRUCT.unpack_from(payload)
     return room_id
 
 def build_join_ack_payload(seq_num: int, room_id: int, player_local_id: int, players: Dict[int, Dict[int, Tuple[int, Tuple[int,int,int]]]]):
-    payload = struct.pack(JOIN_ACK_HEADER_FMT, seq_num, room_id, player_local_id, len(players))
+    payload = bytearray(JOIN_ACK_HEADER_SIZE + len(players) * JOIN_ACK_ENTRY_SIZE)
+    JOIN_ACK_HEADER_STRUCT.pack_into(payload, 0, seq_num, room_id, player_local_id, len(players))
+    offset = JOIN_ACK_HEADER_SIZE
     for player_local_id, (player_id, color) in players.items():
         r, g, b = color
-        payload += struct.pack(JOIN_ACK_ENTRY_FMT, player_id, player_local_id, r, g, b)
+        JOIN_ACK_ENTRY_STRUCT.pack_into(payload, offset, player_id, player_local_id, r, g, b)
+        offset += JOIN_ACK_ENTRY_SIZE
     return payload
 
 def parse_join_ack_payload(payload: bytes):
     if len(payload) < JOIN_ACK_HEADER_SIZE:
         return None
-    (seq_num, room_id, player_local_id, players_count) = struct.unpack(JOIN_ACK_HEADER_FMT, payload[:JOIN_ACK_HEADER_SIZE])
+    (seq_num, room_id, player_local_id, players_count) = JOIN_ACK_HEADER_STRUCT.unpack_from(payload)
     players = {}
     offset = JOIN_ACK_HEADER_SIZE
     for _ in range(players_count):
         if len(payload) < offset + JOIN_ACK_ENTRY_SIZE:
             return None
-        entry = payload[offset:offset + JOIN_ACK_ENTRY_SIZE]
-        player_id, player_local_id, r, g, b = struct.unpack(JOIN_ACK_ENTRY_FMT, entry)
+        player_id, player_local_id, r, g, b = JOIN_ACK_ENTRY_STRUCT.unpack_from(payload, offset)
         players[player_local_id] = (player_id, (r, g, b))
         offset += JOIN_ACK_ENTRY_SIZE
     return (seq_num, room_id, player_local_id, players)
 
 def build_leave_ack_payload(seq_num: int, players: Dict[int, Dict[int, Tuple[int, Tuple[int,int,int]]]]):
-    payload = struct.pack(LEAVE_ACK_HEADER_FMT, seq_num, len(players))
+    payload = bytearray(LEAVE_ACK_HEADER_SIZE + len(players) * LEAVE_ACK_ENTRY_SIZE)
+    LEAVE_ACK_HEADER_STRUCT.pack_into(payload, 0, seq_num, len(players))
+    offset = LEAVE_ACK_HEADER_SIZE
     for player_local_id, (player_id, color) in players.items():
         r, g, b = color
-        payload += struct.pack(LEAVE_ACK_ENTRY_FMT, player_id, player_local_id, r, g, b)
+        LEAVE_ACK_ENTRY_STRUCT.pack_into(payload, offset, player_id, player_local_id, r, g, b)
+        offset += LEAVE_ACK_ENTRY_SIZE
     return payload
 
 def parse_leave_ack_payload(payload: bytes):
     if len(payload) < LEAVE_ACK_HEADER_SIZE:
         return None
-    (seq_num, players_count) = struct.unpack(LEAVE_ACK_HEADER_FMT, payload[:LEAVE_ACK_HEADER_SIZE])
+    (seq_num, players_count) = LEAVE_ACK_HEADER_STRUCT.unpack_from(payload)
     players = {}
     offset = LEAVE_ACK_HEADER_SIZE
     for _ in range(players_count):
         if len(payload) < offset + LEAVE_ACK_ENTRY_SIZE:
             return None
-        entry = payload[offset:offset + LEAVE_ACK_ENTRY_SIZE]
-        player_id, player_local_id, r, g, b = struct.unpack(LEAVE_ACK_ENTRY_FMT, entry)
+        player_id, player_local_id, r, g, b = LEAVE_ACK_ENTRY_STRUCT.unpack_from(payload, offset)
         players[player_local_id] = (player_id, (r, g, b))
         offset += LEAVE_ACK_ENTRY_SIZE
     return (seq_num, players)
 
 def build_list_rooms_ack_payload(seq_num: int, rooms: Dict[int, Tuple[int, str]]):
-    payload = struct.pack(LIST_ROOMS_ACK_HEADER_FMT, seq_num, len(rooms))
-    for room_id, (player_count, room_name) in rooms.items():
-        name_bytes = room_name.encode("utf-8")
+    entries = [(room_id, player_count, room_name.encode("utf-8")) for room_id, (player_count, room_name) in rooms.items()]
+    payload = bytearray(LIST_ROOMS_ACK_HEADER_SIZE + sum(LIST_ROOMS_ACK_ENTRY_SIZE + len(name) for _, _, name in entries))
+    LIST_ROOMS_ACK_HEADER_STRUCT.pack_into(payload, 0, seq_num, len(rooms))
+    offset = LIST_ROOMS_ACK_HEADER_SIZE
+    for room_id, player_count, name_bytes in entries:
         name_len = len(name_bytes)
-        payload += struct.pack(LIST_ROOMS_ACK_ENTRY_FMT, room_id, player_count, name_len)
-        payload += name_bytes
+        LIST_ROOMS_ACK_ENTRY_STRUCT.pack_into(payload, offset, room_id, player_count, name_len)
+        offset += LIST_ROOMS_ACK_ENTRY_SIZE
+        payload[offset:offset + name_len] = name_bytes
+        offset += name_len
     return payload
 
 def parse_list_rooms_ack_payload(payload: bytes):
     if len(payload) < LIST_ROOMS_ACK_HEADER_SIZE:
         return None
 
-    (seq_num, room_count) = struct.unpack(LIST_ROOMS_ACK_HEADER_FMT, payload[:LIST_ROOMS_ACK_HEADER_SIZE])
+    (seq_num, room_count) = LIST_ROOMS_ACK_HEADER_STRUCT.unpack_from(payload)
     rooms = {}
     offset = LIST_ROOMS_ACK_HEADER_SIZE
+    view = memoryview(payload)
 
     for _ in range(room_count):
         if len(payload) < offset + LIST_ROOMS_ACK_ENTRY_SIZE:
             return None
 
-        room_id, player_count, name_len = struct.unpack(
-            LIST_ROOMS_ACK_ENTRY_FMT, payload[offset : offset + LIST_ROOMS_ACK_ENTRY_SIZE]
-        )
+        room_id, player_count, name_len = LIST_ROOMS_ACK_ENTRY_STRUCT.unpack_from(payload, offset)
         offset += LIST_ROOMS_ACK_ENTRY_SIZE
 
-        if len(payload) < offset + name_len:
+        if name_len > MAX_ROOM_NAME or len(payload) < offset + name_len:
+            return None
+        try:
+            room_name = str(view[offset : offset + name_len], "utf-8")
+        except UnicodeDecodeError:
             return None
-        room_name = payload[offset : offset + name_len].decode("utf-8")
         offset += name_len
 
         rooms[room_id] = (player_count, room_name)
@@ -461,67 +556,98 @@ def parse_list_rooms_ack_payload(payload: bytes):
     return (seq_num, rooms)
 
 def build_event_payload(event_type: int, room_id: int, player_local_id: int, cell_idx: int):
-    return struct.pack(EVENT_FMT, event_type, room_id, player_local_id, cell_idx)
+    return EVENT_STRUCT.pack(event_type, room_id, player_local_id, cell_idx)
 
 def parse_event_payload(payload: bytes):
     # verify minimum size
     if len(payload) < EVENT_SIZE:
         return None
-    return struct.unpack(EVENT_FMT, payload[:EVENT_SIZE])
+    return EVENT_STRUCT.unpack_from(payload)
 
-def build_updates_payload(updates: Deque[Tuple[int, int, int]]):
-    payload = struct.pack(UPDATES_HEADER_FMT, len(updates))
-    for (event_type, local_id, cell_idx) in updates:
-        payload += struct.pack(UPDATES_ENTRY_FMT, event_type, local_id, cell_idx)
+def build_updates_payload(updates: Deque[Tuple[int, int, int]], last: int = None):
+    # last: only the newest `last` updates are sent, read straight off the deque without copying it
+    count = len(updates) if last is None else min(last, len(updates))
+    payload = bytearray(UPDATES_HEADER_SIZE + count * UPDATES_ENTRY_SIZE)
+    UPDATES_HEADER_STRUCT.pack_into(payload, 0, count)
+    offset = UPDATES_HEADER_SIZE
+    for (event_type, local_id, cell_idx) in islice(updates, len(updates) - count, None):
+        UPDATES_ENTRY_STRUCT.pack_into(payload, offset, event_type, local_id, cell_idx)
+        offset += UPDATES_ENTRY_SIZE
     return payload
 
 def parse_updates_payload(payload: bytes):
     if len(payload) < UPDATES_HEADER_SIZE:
         return None
 
-    (updates_count,) = struct.unpack(UPDATES_HEADER_FMT, payload[:UPDATES_HEADER_SIZE])
-    updates = deque()
-    offset = UPDATES_HEADER_SIZE
-
-    for _ in range(updates_count):
-        if len(payload) < offset + UPDATES_ENTRY_SIZE:
-            return None
-
-        event_type, local_id, cell_idx = struct.unpack(
-            UPDATES_ENTRY_FMT, payload[offset : offset + UPDATES_ENTRY_SIZE]
-        )
-        offset += UPDATES_ENTRY_SIZE
-        updates.append((event_type, local_id, cell_idx))
+    (updates_count,) = UPDATES_HEADER_STRUCT.unpack_from(payload)
+    end = UPDATES_HEADER_SIZE + updates_count * UPDATES_ENTRY_SIZE
+    if len(payload) < end:
+        return None
 
-    return updates
+    # fixed-size entries: decode them all in one C-level pass
+    return deque(UPDATES_ENTRY_STRUCT.iter_unpack(memoryview(payload)[UPDATES_HEADER_SIZE:end]))
 
-def build_updates_ack_payload(seq_num: int):
-    return struct.pack(UPDATES_ACK_FMT, seq_num)
+def build_updates_ack_payload(seq_nums: List[int]):
+    # one entry per seq; a single seq encodes exactly as the original one-seq ACK
+    payload = bytearray(len(seq_nums) * UPDATES_ACK_SIZE)
+    for i, seq_num in enumerate(seq_nums):
+        UPDATES_ACK_STRUCT.pack_into(payload, i * UPDATES_ACK_SIZE, seq_num)
+    return payload
 
 def parse_updates_ack_payload(payload: bytes):
     # verify minimum size
-    if len(payload) < UPDATES_ACK_SIZE:
+    count = len(payload) // UPDATES_ACK_SIZE
+    if count == 0:
         return None
-    (seq_num,) = struct.unpack(UPDATES_ACK_FMT, payload[:UPDATES_ACK_SIZE])
-    return seq_num
+    return [seq_num for (seq_num,) in UPDATES_ACK_STRUCT.iter_unpack(memoryview(payload)[:count * UPDATES_ACK_SIZE])]
 
-def build_snapshot_payload(grid: List[int]):
-    return struct.pack(SNAPSHOT_FMT, *grid)
-
-def parse_snapshot_payload(payload: bytes):
+def parse_snapshot_payload(payload: bytes, out=None):
     if len(payload) < SNAPSHOT_SIZE:
         return None
-    return list(struct.unpack(SNAPSHOT_FMT, payload[:SNAPSHOT_SIZE]))
+    # zero-copy view; with out (a TOTAL_CELLS bytearray) the grid is copied into it in place
+    grid = memoryview(payload)[:SNAPSHOT_SIZE]
+    if out is None:
+        return grid
+    out[:] = grid
+    return out
 
 def build_snapshot_ack_payload(seq_num: int):
-    return struct.pack(SNAPSHOT_ACK_FMT, seq_num)
+    return SNAPSHOT_ACK_STRUCT.pack(seq_num)
 
 def parse_snapshot_ack_payload(payload: bytes):
     if len(payload) < SNAPSHOT_ACK_SIZE:
         return None
-    (seq_num,) = struct.unpack(SNAPSHOT_ACK_FMT, payload[:SNAPSHOT_ACK_SIZE])
+    (seq_num,) = SNAPSHOT_ACK_STRUCT.unpack_from(payload)
     return seq_num
 
+"""  Socket buffers """
+SOCKET_BUFFER_BYTES = 4 * 1024 * 1024  # requested SO_RCVBUF / SO_SNDBUF; the kernel caps it at net.core.[rw]mem_max
+
+def tune_socket_buffers(sock: socket.socket, size: int = SOCKET_BUFFER_BYTES) -> Tuple[int, int]:
+    """Enlarge the kernel send/receive buffers so bursts queue instead of being dropped; returns the effective (rcv, snd)."""
+    for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, opt, size)
+        except OSError:
+            pass  # keep the OS default
+    return (sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF))
+
+IP_TOS_EF = 0xB8  # DSCP Expedited Forwarding, the usual marking for latency-sensitive game traffic
+
+def tune_socket_tos(sock: socket.socket, tos: int = IP_TOS_EF) -> int:
+    """Mark outgoing packets for low-latency queuing where the network honours DSCP; returns the effective TOS."""
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, tos)
+    except OSError:
+        pass  # keep the OS default
+    return sock.getsockopt(socket.IPPROTO_IP, socket.IP_TOS)
+
+def debug_enabled():
+    # per-packet traces are only built when the root logger is at DEBUG (--debug);
+    # check this before formatting them
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
 def log(*args, **kwargs):
     if logging.getLogger().hasHandlers():
         message = " ".join(str(a) for a in args)
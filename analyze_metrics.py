@@ -1,36 +1,61 @@
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
 import os
-import json
-import math
+import gc
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow  # optional: multithreaded CSV parser
+    csv_engine = "pyarrow"
+except ImportError:
+    csv_engine = "c"
 
 results_dir = "./results_raw"
 merged_path = "./results/metrics.csv"
 summary_path = "./results/summary.csv"
 plots_dir = "./plots"
 
+# Copy-on-write (pandas 2.x) lets drop/rename share column data instead of copying it
+if int(pd.__version__.split(".")[0]) >= 2:
+    pd.set_option("mode.copy_on_write", True)
+
 os.makedirs("./results", exist_ok=True)
 os.makedirs(plots_dir, exist_ok=True)
 
 print("[merge] Loading server + client files...")
 
-server_frames = []
-client_frames = []
+# Column types written by MetricsLogger; declaring them skips dtype inference
+csv_dtypes = {
+    "client_id": "int64", "snapshot_id": "int64", "seq_num": "int64",
+    "server_timestamp_ms": "int64", "recv_time_ms": "int64",
+    "latency_ms": "float64", "jitter_ms": "float64", "positions": "string",
+    "cpu_percent": "float64", "bandwidth_per_client_kbps": "float64", "loss": "float64",
+}
 
-for f in os.listdir(results_dir):
-    if not f.endswith(".csv"):
-        continue
+def read_metrics_csv(path):
+    try:
+        return pd.read_csv(path, engine=csv_engine, dtype=csv_dtypes)
+    except ValueError:
+        # corrupted rows (e.g. a partially written line): let pandas infer, clean up later
+        print(f"[merge] {path} does not match the schema, reading untyped")
+        return pd.read_csv(path)
 
-    df = pd.read_csv(os.path.join(results_dir, f))
+# Pick the CSVs up front, then parse them concurrently (the C tokenizer releases the GIL)
+files = [f for f in os.listdir(results_dir) if f.endswith(".csv")]
+with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+    frames = list(ex.map(read_metrics_csv, [os.path.join(results_dir, f) for f in files]))
 
-    if "server" in f:
-        server_frames.append(df)
-    else:
-        client_frames.append(df)
+server_frames = [df for f, df in zip(files, frames) if "server" in f]
+client_frames = [df for f, df in zip(files, frames) if "server" not in f]
 
 server_df = pd.concat(server_frames, ignore_index=True)
 client_df = pd.concat(client_frames, ignore_index=True)
+del frames, server_frames, client_frames
 
 print(f"[merge] Server rows: {len(server_df)}, Client rows: {len(client_df)}")
 
@@ -41,86 +66,90 @@ for c in ["client_id","seq_num","snapshot_id","server_timestamp_ms","positions",
           "latency_ms","jitter_ms","bandwidth_per_client_kbps"]:
     if c not in client_df: client_df[c] = np.nan
 
-# --- Decode grid JSON ---
-def decode_grid(g):
-    if pd.isna(g):
-        return None
-    try:
-        return list(map(int, json.loads(g)))
-    except:
-        try:
-            return list(map(int, g.strip("[]").split(",")))
-        except:
-            return None
-
-def csv_to_positions(csv_str):
-    if pd.isna(csv_str) or not str(csv_str).strip():
-        return {}  # empty CSV
-    
-    positions = {}
-    
-    items = csv_str.split(";")
-    for item in items:
-        pid_str, x_str, y_str = item.split(",")
-        pid = int(pid_str)
-        x = int(x_str)
-        y = int(y_str)
-        positions[pid] = (x, y)
-
-    return positions
-
-
-server_df["positions"] = server_df["positions"].apply(csv_to_positions)
-client_df["positions"] = client_df["positions"].apply(csv_to_positions)
+# --- client_id as a shared categorical: joins and groupbys run on small integer codes ---
+client_id_dtype = pd.CategoricalDtype(np.union1d(server_df["client_id"].dropna(), client_df["client_id"].dropna()))
+server_df["client_id"] = server_df["client_id"].astype(client_id_dtype)
+client_df["client_id"] = client_df["client_id"].astype(client_id_dtype)
 
 # ----------------------------------------------------------
 #  JOIN: server + client on (client_id, seq_num, snapshot_id)
 # ----------------------------------------------------------
-merged = pd.merge(
-    client_df,
-    server_df,
-    on=["client_id", "seq_num", "snapshot_id"],
-    suffixes=("_client", "_server"),
-    how="left"
-)
+join_keys = ["client_id", "seq_num", "snapshot_id"]
+
+def pack_keys(left, right):
+    # Pack the join columns into one int64 per row, giving each column just the bits its
+    # largest value needs; None when they aren't non-negative integers or don't fit in 63 bits
+    packed = [np.zeros(len(left), dtype=np.int64), np.zeros(len(right), dtype=np.int64)]
+    shift = 0
+    for c in reversed(join_keys):
+        cols = [left[c].to_numpy(), right[c].to_numpy()]
+        if any(col.dtype.kind not in "iu" or (col.size and col.min() < 0) for col in cols):
+            return None
+        packed = [p | (col.astype(np.int64) << shift) for p, col in zip(packed, cols)]
+        shift += int(max(col.max() if col.size else 0 for col in cols)).bit_length()
+        if shift > 63:
+            return None
+    return packed
+
+packed = pack_keys(client_df, server_df)
+if packed is not None:
+    # single int64 key: one hash per row instead of a three-column tuple hash
+    client_key, server_key = packed
+    merged = (
+        client_df.assign(join_key=client_key)
+        .join(server_df.drop(columns=join_keys).set_axis(server_key), on="join_key",
+              how="left", lsuffix="_client", rsuffix="_server")
+        .drop(columns="join_key")
+        .reset_index(drop=True)
+    )
+else:
+    merged = pd.merge(
+        client_df,
+        server_df,
+        on=join_keys,
+        suffixes=("_client", "_server"),
+        how="left"
+    )
 
 print("[merge] Joined rows:", len(merged))
 
+# Only the merged frame is needed from here on
+del server_df, client_df, packed
+
 # ----------------------------------------------------------
 #  COMPUTE PERCEIVED POSITION ERROR
 # ----------------------------------------------------------
-def compute_error(server_positions, client_positions):
-    errors = []
-    
-    if not isinstance(server_positions, dict) or not isinstance(client_positions, dict):
-        return float('nan')
-    
-    for pid, spos in server_positions.items():
-        if pid not in client_positions:
-            continue
-
-        cx, cy = client_positions[pid]
-        sx, sy = spos
-
-        d = math.sqrt((cx - sx)**2 + (cy - sy)**2)
-        errors.append(d)
-
-    if not errors:
-        return float('nan')
-
-    return sum(errors) / len(errors)
-
-merged["perceived_position_error"] = merged.apply(
-    lambda r: compute_error(r["positions_server"], r["positions_client"]),
-    axis=1
+def positions_long(col):
+    # Parse a column of "pid,x,y;pid,x,y" strings in one bulk pass into one row per (merged row, pid);
+    # empty rows (and NaN after the left join) contribute nothing
+    strs = col.fillna("").astype(str).str.strip()
+    has_positions = strs != ""
+    counts = np.where(has_positions, strs.str.count(";") + 1, 0)
+    flat = np.fromstring(",".join(strs[has_positions]).replace(";", ","), dtype=np.int64, sep=",").reshape(-1, 3)
+    long = pd.DataFrame({
+        "row_id": np.repeat(col.index.to_numpy(), counts),
+        "pid": flat[:, 0], "x": flat[:, 1], "y": flat[:, 2],
+    })
+    # a pid repeated within one row keeps its last position
+    return long.drop_duplicates(["row_id", "pid"], keep="last")
+
+# Mean Euclidean distance over the pids present on both sides, NaN when there are none
+server_long = positions_long(merged["positions_server"])
+client_long = positions_long(merged["positions_client"])
+pairs = server_long.merge(client_long, on=["row_id", "pid"], suffixes=("_server", "_client"))
+dist = np.hypot(pairs["x_client"].to_numpy() - pairs["x_server"].to_numpy(),
+                pairs["y_client"].to_numpy() - pairs["y_server"].to_numpy())
+merged["perceived_position_error"] = (
+    pd.Series(dist).groupby(pairs["row_id"].to_numpy()).mean().reindex(merged.index)
 )
+del server_long, client_long, pairs, dist
 
 # Drop positions to reduce file size
 merged = merged.drop(columns=["positions_client", "positions_server"])
 
 # Ensure server timestamp is consistent
 if "server_timestamp_ms_client" in merged.columns and "server_timestamp_ms_server" in merged.columns:
-    mismatches = (merged["server_timestamp_ms_client"] != merged["server_timestamp_ms_server"]).sum()
+    mismatches = np.count_nonzero(merged["server_timestamp_ms_client"].to_numpy() != merged["server_timestamp_ms_server"].to_numpy())
     if mismatches > 0:
         print(f"[warning] {mismatches} rows have mismatched server timestamps!")
     # Keep only server column
@@ -129,13 +158,15 @@ if "server_timestamp_ms_client" in merged.columns and "server_timestamp_ms_serve
 
 merged.to_csv(merged_path, index=False)
 print(f"[merge] Final merged file saved at: {merged_path}")
+gc.collect()
 
 # -----------------------------
 #  ANALYSIS
 # -----------------------------
-df = merged.copy()
+df = merged
+del merged
 
-# Convert numeric columns
+# Convert numeric columns (no-op for files read with the schema)
 cols_to_numeric = ["latency_ms", "jitter_ms", "perceived_position_error", "cpu_percent", "bandwidth_per_client_kbps", "loss"]
 for c in cols_to_numeric:
     df[c] = pd.to_numeric(df[c], errors="coerce")
@@ -145,38 +176,67 @@ df = df.dropna(subset=["latency_ms", "jitter_ms"])
 after = len(df)
 print(f"[clean] Removed {before-after} corrupted rows, remaining: {after}")
 
-# 20 updates/sec validation
-df["server_timestamp_ms"] = pd.to_numeric(df["server_timestamp_ms"], errors="coerce")
-df["timestamp_sec"] = (df["server_timestamp_ms"] // 1000).astype(int)
+# Identify clients by having bandwidth column; server rows carry cpu_percent instead
+bw_df = df[df["bandwidth_per_client_kbps"].notna()]
+cpu_df = df[df["cpu_percent"].notna()]
 
-# Identify clients by having bandwidth column
-updates_per_client_sec = df[df["bandwidth_per_client_kbps"].notna()].groupby(["client_id", "timestamp_sec"]).size().reset_index(name="count")
+# 20 updates/sec validation; a row the join left without a server timestamp has no second to
+# count in (NaN would cast to INT32_MIN)
+bw_df = bw_df.assign(server_timestamp_ms=pd.to_numeric(bw_df["server_timestamp_ms"], errors="coerce"))
+bw_df = bw_df[bw_df["server_timestamp_ms"].notna()]
+bw_df = bw_df.assign(timestamp_sec=(bw_df["server_timestamp_ms"].to_numpy() // 1000).astype(np.int32))
+
+updates_per_client_sec = bw_df.groupby(["client_id", "timestamp_sec"], observed=True).size().reset_index(name="count")
 avg_updates_per_client = updates_per_client_sec["count"].mean()
 min_updates_per_client = updates_per_client_sec["count"].min()
 max_updates_per_client = updates_per_client_sec["count"].max()
 
-last_bw_per_client = df[df["bandwidth_per_client_kbps"].notna()].groupby("client_id")["bandwidth_per_client_kbps"].last()
+# Every per-client aggregate in one groupby pass; last() skips NaN like the old per-column filters
+per_client = df.groupby("client_id", observed=True).agg(
+    bw_last=("bandwidth_per_client_kbps", "last"),
+    loss_last=("loss", "last"),
+    loss_mean=("loss", "mean"),
+    error_mean=("perceived_position_error", "mean"),
+)
+
+last_bw_per_client = per_client["bw_last"].dropna()
 
 # Compute average across clients
 avg_bw_kbps = last_bw_per_client.mean()
 
-last_loss_per_client = df[df["loss"].notna()].groupby("client_id")["loss"].last()
+last_loss_per_client = per_client["loss_last"].dropna()
 avg_loss = last_loss_per_client.mean()
 
 
-def pct95(x): return np.percentile(x.dropna(), 95)
+# Materialize the stat columns once; NaN-aware reductions skip missing values
+stat_cols = ["latency_ms", "jitter_ms", "perceived_position_error", "cpu_percent"]
+LAT, JIT, ERR, CPU = range(len(stat_cols))
+clean = df[stat_cols].to_numpy(dtype=np.float64)
+means = np.nanmean(clean, axis=0)
+medians = np.nanmedian(clean, axis=0)
+
+def pct95(a):
+    # Linear-interpolated 95th percentile via a partial sort of the two neighbouring ranks
+    a = a[~np.isnan(a)]
+    if a.size == 0:
+        return float('nan')
+    pos = 0.95 * (a.size - 1)
+    k = int(pos)
+    k1 = min(k + 1, a.size - 1)
+    part = np.partition(a, [k, k1])
+    return part[k] + (part[k1] - part[k]) * (pos - k)
 
 stats = {
-    "Mean Latency (ms)": df["latency_ms"].mean(),
-    "Median Latency (ms)": df["latency_ms"].median(),
-    "95th Latency (ms)": pct95(df["latency_ms"]),
-    "Mean Jitter (ms)": df["jitter_ms"].mean(),
-    "Median Jitter (ms)": df["jitter_ms"].median(),
-    "95th Jitter (ms)": pct95(df["jitter_ms"]),
-    "Mean Error": df["perceived_position_error"].mean(),
-    "95th Error": pct95(df["perceived_position_error"]),
-    "Avg CPU% (server only)": df[df["cpu_percent"].notna()]["cpu_percent"].mean(),
-    "Max CPU% (server only)": df[df["cpu_percent"].notna()]["cpu_percent"].max(),
+    "Mean Latency (ms)": means[LAT],
+    "Median Latency (ms)": medians[LAT],
+    "95th Latency (ms)": pct95(clean[:, LAT]),
+    "Mean Jitter (ms)": means[JIT],
+    "Median Jitter (ms)": medians[JIT],
+    "95th Jitter (ms)": pct95(clean[:, JIT]),
+    "Mean Error": means[ERR],
+    "95th Error": pct95(clean[:, ERR]),
+    "Avg CPU% (server only)": means[CPU],
+    "Max CPU% (server only)": np.nanmax(clean[:, CPU]),
     "Avg Bandwidth (kbps per client)": avg_bw_kbps,
     "Total Packets Logged": len(df),
     "Avg Updates/sec": avg_updates_per_client,
@@ -195,128 +255,151 @@ print(f"[ANALYSIS] Summary saved to {summary_path}")
 # -----------------------------
 # PLOTS
 # -----------------------------
+# One Figure/Axes is reused for every plot; each plot function draws onto a cleared ax
+fig, ax = plt.subplots(figsize=(6,4))
+
+def save(name, plot_fn):
+    ax.clear()
+    plot_fn(ax)
+    fig.savefig(os.path.join(plots_dir, name), dpi=72)
+
+def downsample(x, y, n_buckets=2000):
+    # Keep the min and max of each bucket so the drawn envelope matches the full series
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.argsort(x, kind="stable")
+    x, y = x[order], y[order]
+    if len(x) <= 2 * n_buckets:
+        return x, y
+    starts = np.linspace(0, len(x), n_buckets, endpoint=False).astype(np.intp)
+    lo = np.fmin.reduceat(y, starts)
+    hi = np.fmax.reduceat(y, starts)
+    return np.repeat(x[starts], 2), np.column_stack((lo, hi)).ravel()
+
 # Latency CDF
-plt.figure(figsize=(6,4))
-sorted_lat = np.sort(df["latency_ms"])
-p = np.arange(len(sorted_lat)) / len(sorted_lat)
-plt.plot(sorted_lat, p)
-plt.xlabel("Latency (ms)")
-plt.ylabel("CDF")
-plt.title("Latency CDF")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "latency_cdf.png"))
+def plot_latency_cdf(ax):
+    sorted_lat = np.sort(clean[:, LAT])
+    p = np.linspace(0, 1, len(sorted_lat), endpoint=False)
+    ax.plot(sorted_lat, p)
+    ax.set_xlabel("Latency (ms)")
+    ax.set_ylabel("CDF")
+    ax.set_title("Latency CDF")
+    ax.grid(True)
+save("latency_cdf.png", plot_latency_cdf)
 
 # Latency over time
-plt.figure(figsize=(6,4))
-plt.plot(df["server_timestamp_ms"], df["latency_ms"])
-plt.title("Latency Over Time")
-plt.xlabel("Time (ms)")
-plt.ylabel("Latency (ms)")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "latency_timeseries.png"))
+def plot_latency_timeseries(ax):
+    ax.plot(*downsample(df["server_timestamp_ms"], df["latency_ms"]))
+    ax.set_title("Latency Over Time")
+    ax.set_xlabel("Time (ms)")
+    ax.set_ylabel("Latency (ms)")
+    ax.grid(True)
+save("latency_timeseries.png", plot_latency_timeseries)
 
 # Jitter over time
-plt.figure(figsize=(6,4))
-plt.plot(df["server_timestamp_ms"], df["jitter_ms"])
-plt.title("Jitter Over Time")
-plt.xlabel("Time (ms)")
-plt.ylabel("Jitter (ms)")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "jitter_timeseries.png"))
+def plot_jitter_timeseries(ax):
+    ax.plot(*downsample(df["server_timestamp_ms"], df["jitter_ms"]))
+    ax.set_title("Jitter Over Time")
+    ax.set_xlabel("Time (ms)")
+    ax.set_ylabel("Jitter (ms)")
+    ax.grid(True)
+save("jitter_timeseries.png", plot_jitter_timeseries)
 
 # Per-client final loss comparison
-plt.figure(figsize=(6,4))
-plt.bar(last_loss_per_client.index.astype(str), last_loss_per_client.values)
-plt.title("Final Loss per Client")
-plt.xlabel("Client ID")
-plt.ylabel("Loss (%)")
-plt.grid(True, axis='y')
-plt.savefig(os.path.join(plots_dir, "per_client_loss.png"))
-
+def plot_per_client_loss(ax):
+    ax.bar(last_loss_per_client.index.astype(str), last_loss_per_client.values)
+    ax.set_title("Final Loss per Client")
+    ax.set_xlabel("Client ID")
+    ax.set_ylabel("Loss (%)")
+    ax.grid(True, axis='y')
+save("per_client_loss.png", plot_per_client_loss)
 
 # Server CPU usage
-plt.figure(figsize=(6,4))
-plt.plot(df[df["cpu_percent"].notna()]["cpu_percent"])
-plt.title("Server CPU Usage")
-plt.xlabel("Samples")
-plt.ylabel("CPU (%)")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "cpu_timeseries.png"))
-
-
-
+def plot_cpu_timeseries(ax):
+    ax.plot(cpu_df["cpu_percent"])
+    ax.set_title("Server CPU Usage")
+    ax.set_xlabel("Samples")
+    ax.set_ylabel("CPU (%)")
+    ax.grid(True)
+save("cpu_timeseries.png", plot_cpu_timeseries)
 
 # Latency histogram
-plt.figure(figsize=(6,4))
-plt.hist(df["latency_ms"], bins=40)
-plt.title("Latency Histogram")
-plt.xlabel("Latency (ms)")
-plt.ylabel("Count")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "latency_histogram.png"))
+def plot_latency_histogram(ax):
+    ax.hist(df["latency_ms"], bins=40)
+    ax.set_title("Latency Histogram")
+    ax.set_xlabel("Latency (ms)")
+    ax.set_ylabel("Count")
+    ax.grid(True)
+save("latency_histogram.png", plot_latency_histogram)
 
 # Per-client update frequency
-plt.figure(figsize=(6,4))
-for client_id, group in updates_per_client_sec.groupby("client_id"):
-    plt.plot(group["timestamp_sec"], group["count"], label=f"Client {client_id}")
-plt.axhline(20, linestyle="--", color="gray", label="20 updates/sec target")
-plt.xlabel("Second")
-plt.ylabel("Updates/sec")
-plt.title("Per-Client Update Frequency")
-plt.legend()
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "per_client_snapshots.png"))
+def plot_per_client_snapshots(ax):
+    # one LineCollection for all clients, with proxy artists for the legend
+    client_ids, segments = [], []
+    for client_id, g in updates_per_client_sec.groupby("client_id", observed=True):
+        client_ids.append(client_id)
+        segments.append(np.column_stack((g["timestamp_sec"].to_numpy(), g["count"].to_numpy())))
+    colors = plt.cm.tab10(np.arange(len(segments)) % 10)
+    ax.add_collection(LineCollection(segments, colors=colors))
+    ax.autoscale_view()
+    handles = [Line2D([], [], color=c, label=f"Client {client_id}") for client_id, c in zip(client_ids, colors)]
+    handles.append(ax.axhline(20, linestyle="--", color="gray", label="20 updates/sec target"))
+    ax.set_xlabel("Second")
+    ax.set_ylabel("Updates/sec")
+    ax.set_title("Per-Client Update Frequency")
+    # loc="best" ignores LineCollection paths; the ramp-up/ramp-down ends leave the bottom middle free
+    ax.legend(handles=handles, loc="lower center")
+    ax.grid(True)
+save("per_client_snapshots.png", plot_per_client_snapshots)
 
 
 # Position Error vs Loss Rate (1 point per client)
 clients = df["client_id"].unique()
 
-avg_loss_per_client = df.groupby("client_id")["loss"].mean()
-avg_error_per_client = df.groupby("client_id")["perceived_position_error"].mean()
-
-plt.figure(figsize=(6,4))
-plt.scatter(avg_loss_per_client, avg_error_per_client)
-
-for client_id in clients:
-    plt.text(avg_loss_per_client[client_id], avg_error_per_client[client_id], str(client_id),
-             fontsize=9, ha='right', va='bottom')
-
-plt.title("Average Position Error vs Average Loss per Client")
-plt.xlabel("Average Loss (%)")
-plt.ylabel("Average Position Error")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "avg_error_vs_avg_loss_per_client.png"))
+avg_loss_per_client = per_client["loss_mean"]
+avg_error_per_client = per_client["error_mean"]
 
+def plot_error_vs_loss(ax):
+    ax.scatter(avg_loss_per_client, avg_error_per_client)
+    for client_id in clients:
+        ax.text(avg_loss_per_client[client_id], avg_error_per_client[client_id], str(client_id),
+                fontsize=9, ha='right', va='bottom')
+    ax.set_title("Average Position Error vs Average Loss per Client")
+    ax.set_xlabel("Average Loss (%)")
+    ax.set_ylabel("Average Position Error")
+    ax.grid(True)
+save("avg_error_vs_avg_loss_per_client.png", plot_error_vs_loss)
 
 
 # Compare final bandwidth between clients
-plt.figure(figsize=(6,4))
-plt.bar(last_bw_per_client.index.astype(str), last_bw_per_client.values)
-plt.title("Final Bandwidth per Client")
-plt.xlabel("Client ID")
-plt.ylabel("Bandwidth (kbps)")
-plt.grid(True, axis='y')
-plt.savefig(os.path.join(plots_dir, "per_client_bandwidth.png"))
+def plot_per_client_bandwidth(ax):
+    ax.bar(last_bw_per_client.index.astype(str), last_bw_per_client.values)
+    ax.set_title("Final Bandwidth per Client")
+    ax.set_xlabel("Client ID")
+    ax.set_ylabel("Bandwidth (kbps)")
+    ax.grid(True, axis='y')
+save("per_client_bandwidth.png", plot_per_client_bandwidth)
 
 # Per-client average updates/sec and perceived error
-avg_updates_per_client = updates_per_client_sec.groupby("client_id")["count"].mean().reset_index()
+avg_updates_per_client = updates_per_client_sec.groupby("client_id", observed=True)["count"].mean().reset_index()
 avg_updates_per_client.columns = ["client_id", "avg_updates_per_sec"]
 
-avg_error_per_client = df.groupby("client_id")["perceived_position_error"].mean().reset_index()
-avg_error_per_client.columns = ["client_id", "avg_error"]
+avg_error_per_client = per_client["error_mean"].rename("avg_error").reset_index()
 
 client_error_update = pd.merge(avg_updates_per_client, avg_error_per_client, on="client_id")
-plt.figure(figsize=(6,4))
-plt.scatter(client_error_update["avg_updates_per_sec"], client_error_update["avg_error"])
-for idx, row in client_error_update.iterrows():
-    plt.text(row["avg_updates_per_sec"], row["avg_error"], str(int(row["client_id"])),
-             fontsize=9, ha='right', va='bottom')
-
-plt.xlabel("Average Updates per Second")
-plt.ylabel("Average Perceived Error")
-plt.title("Per-Client Update Rate vs Perceived Error")
-plt.grid(True)
-plt.savefig(os.path.join(plots_dir, "error_vs_update_rate_per_client.png"))
+
+def plot_error_vs_update_rate(ax):
+    ax.scatter(client_error_update["avg_updates_per_sec"], client_error_update["avg_error"])
+    for idx, row in client_error_update.iterrows():
+        ax.text(row["avg_updates_per_sec"], row["avg_error"], str(int(row["client_id"])),
+                fontsize=9, ha='right', va='bottom')
+    ax.set_xlabel("Average Updates per Second")
+    ax.set_ylabel("Average Perceived Error")
+    ax.set_title("Per-Client Update Rate vs Perceived Error")
+    ax.grid(True)
+save("error_vs_update_rate_per_client.png", plot_error_vs_update_rate)
+
+plt.close(fig)
 
 
 print("[ANALYSIS] All plots saved.")
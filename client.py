@@ -1,4 +1,5 @@
-import time, random, socket, select
+import time, random, socket, selectors, heapq
+from itertools import islice
 
 # === Copy shared protocol definitions ===
 from ESP_config import *
@@ -9,6 +10,13 @@ class ESPClientProtocol:
         self.server_addr = server_addr
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setblocking(False)
+        rcvbuf, sndbuf = tune_socket_buffers(self.sock)
+        log(f"[Client] Socket buffers: rcv={rcvbuf} snd={sndbuf} bytes")
+        log(f"[Client] Socket TOS: 0x{tune_socket_tos(self.sock):02x}")
+        self.sendto = self.sock.sendto  # bound once; send() runs per packet
+        # every datagram is received into this one buffer; parse_packet works on views of it
+        self.recv_buf = bytearray(RECV_BUFSIZE)
+        self.recv_view = memoryview(self.recv_buf)
         metrices_id = metrices_id if metrices_id is not None else random.randint(1000,9999)
         self.fragment_manager = FragmentManager()
         self.islogging = islogging
@@ -20,12 +28,24 @@ class ESPClientProtocol:
 
     
         self.tasks = {
-            "retransmit": {"interval": 0.2, "last": 0.0, "func": self.retransmit},
-            "check_pending_cells": {"interval": 0.2, "last": 0.0, "func": self.check_pending_cells},
+            "retransmit": {"interval": 0.2, "last": 0.0, "func": self.retransmit},  # also times out pending cells
             "fragment_cleanup": {"interval": 1.0, "last": 0.0, "func": self.fragment_manager.cleanup},
             "test":{"interval": 3.0, "last": 0.0, "func": self.test_behavior},
         } 
         
+        self.payload_handlers = {  # msg_type -> handler(payload)
+            MSG_INIT_ACK: self.handle_init_ack,
+            MSG_CREATE_ACK: self.handle_create_ack,
+            MSG_JOIN_ACK: self.handle_join_ack,
+            MSG_LEAVE_ACK: self.handle_leave_ack,
+            MSG_LIST_ROOMS_ACK: self.handle_list_rooms_ack,
+        }
+        self.pkt_handlers = {  # msg_type -> handler(pkt)
+            MSG_EVENT: self.handle_event,
+            MSG_UPDATES: self.handle_updates,
+            MSG_SNAPSHOT: self.handle_snapshot,
+        }
+        
         self.rooms = {}
         self.player_id = None
         self.players = {}
@@ -33,130 +53,129 @@ class ESPClientProtocol:
         self.pkt_id = 1
         self.room_id = None
         self.local_id = None
-        self.grid = [0] * TOTAL_CELLS
+        self.grid = bytearray(TOTAL_CELLS)  # 0 = free, else player_local_id
         self.positions = {} # player_id -> (x,y)
 
         # === Reliability ===
-        self.unacked_packets = {}   # seq -> {'packet': bytes, 'last_sent': time.time_ns(), 'msg_type': int, 'sent_count':int}
+        self.unacked_packets = {}   # seq -> UnackedPacket
+        self.retransmit_heap = []   # (deadline_ns, seq); acked seqs are skipped when they surface
         self.snapshot_id = 0
+        self.installed_snapshot_id = None  # id of the last full snapshot copied into the grid
 
         # === Cell ownership ===
-        self.pending_cells = {}     # cell_idx -> timestamp when requested
-        self.owned_cells = set()    # confirmed cells owned by this player
+        self.pending_cells = OrderedDict()  # cell_idx -> timestamp when requested, oldest first
         if send_init:
             self.send_init()
 
     
     def run(self, duration=None, test=None):
+        # sleep until the socket is readable or the next task is due, whichever comes first
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ)
+        task_heap = [(t["last"] + t["interval"], name) for name, t in self.tasks.items()
+                     if name != "test" or test is not None]  # (next_fire, name)
+        heapq.heapify(task_heap)
         try:
             log(f"[Client] Running (Ctrl+C to stop)")
             start = time.time()
+            end = start + duration if duration else None
             while True:
-                if duration and (time.time() - start) >= duration:
+                now = time.time()
+                if end is not None and now >= end:
                     log(f"[Client] Test duration ended, client stopped")
                     self.disconnect()
                     break
-                    
-                # wait for readability up to 0.01ms
-                rlist, _, _ = select.select([self.sock], [], [], 0.01)
 
-                if rlist:
+                wake = min(task_heap[0][0], end) if end is not None else task_heap[0][0]
+                if sel.select(max(0.0, wake - now)):
                     self.handle_recv()
                 
                 now = time.time()
-                for name, t in self.tasks.items():
-                    if name=="test" and test is None:
-                        continue
-                    
-                    if now - t["last"] >= t["interval"]:
-                        try:
-                            if name=="test":
-                                t["func"](test)
-                            else:
-                                t["func"]()
-                        except Exception as e:
-                            log(f"[Client] {name} error:", e)
-                        t["last"] = now
+                while task_heap and task_heap[0][0] <= now:
+                    _, name = heapq.heappop(task_heap)
+                    t = self.tasks[name]
+                    try:
+                        if name=="test":
+                            t["func"](test)
+                        else:
+                            t["func"]()
+                    except Exception as e:
+                        log(f"[Client] {name} error:", e)
+                    t["last"] = now
+                    heapq.heappush(task_heap, (now + t["interval"], name))
                        
         except KeyboardInterrupt:
             log(f"[Client] Stopping by user (Ctrl+C).")
             self.disconnect()
             return
+        finally:
+            sel.close()
             
     
     def handle_recv(self):
-        while True:
+        now = time.monotonic()  # one clock sample per wake for fragment bookkeeping
+        for _ in range(CLIENT_RECV_BATCH):  # bounded drain per wake; the selector re-arms for the rest
             try:
-                data, addr = self.sock.recvfrom(65536)
-                self.bytes_received += len(data)
+                nbytes, addr = self.sock.recvfrom_into(self.recv_buf)
             except BlockingIOError:
                 return
             except Exception as e:
                 log("[SERVER] recv error:", e)
                 return
-                        
-            pkt = parse_packet(data)
-            if pkt is None:
-                continue
+            if nbytes > MAX_PACKET:
+                continue  # larger than any packet we build
+            self.bytes_received += nbytes
+            self.handle_datagram(self.recv_view[:nbytes], addr, now)
 
-            
-            frag_result = self.fragment_manager.add_fragment(addr, pkt['pkt_id'], pkt['seq'], pkt['payload_len'], pkt['payload'])
-            if frag_result is None:
-                continue # waiting for more fragments
-            
-            (seq_keys, payload) = frag_result
-            
-            
-            pkt['payload'] = payload
-            pkt['seq_keys'] = seq_keys
-            msg_type = pkt['msg_type']
-
-            if msg_type == MESSAGE_TYPES['INIT_ACK']:
-                self.handle_init_ack(payload)
-            elif msg_type == MESSAGE_TYPES['CREATE_ACK']:
-                self.handle_create_ack(payload)
-            elif msg_type == MESSAGE_TYPES['JOIN_ACK']:
-                self.handle_join_ack(payload)
-            elif msg_type == MESSAGE_TYPES['LEAVE_ACK']:
-                self.handle_leave_ack(payload)
-            elif msg_type == MESSAGE_TYPES['LIST_ROOMS_ACK']:
-                self.handle_list_rooms_ack(payload)
-            elif msg_type == MESSAGE_TYPES['EVENT']:
-                self.handle_event(pkt)
-            elif msg_type == MESSAGE_TYPES['UPDATES']:
-                self.handle_updates(pkt)
-            elif msg_type == MESSAGE_TYPES['SNAPSHOT']:
-                self.handle_snapshot(pkt)
+    def handle_datagram(self, data, addr, now):
+        pkt = parse_packet(data)
+        if pkt is None:
+            return
+
+        frag_result = self.fragment_manager.add_fragment(addr, pkt.pkt_id, pkt.seq, pkt.payload_len, pkt.payload, now)
+        if frag_result is None:
+            return # waiting for more fragments
+        
+        (seq_keys, payload) = frag_result
+        pkt = pkt._replace(payload=payload, seq_keys=seq_keys)
+        msg_type = pkt.msg_type
+
+        handler = self.payload_handlers.get(msg_type)
+        if handler is not None:
+            handler(payload)
+        else:
+            handler = self.pkt_handlers.get(msg_type)
+            if handler is not None:
+                handler(pkt)
             else:
                 log(f"[Client] Unknown msg type {msg_type}")
-                
-            if pkt['seq'] not in self.seen_seq:
-                self.packets_received += 1
-                self.seen_seq.add(pkt['seq'])
+            
+        if pkt.seq not in self.seen_seq:
+            self.packets_received += 1
+            self.seen_seq.add(pkt.seq)
 
     # === Send helpers ===
-    def send(self, msg_type, payload=b'', ack=True, repeat=1):
+    def send(self, msg_type, payload=b'', ack=True, repeat=1, ts=None):
         if ack:
             repeat = 1
             
         if repeat < 1:
             return False
         
-        pkts = build_packet(msg_type, self.pkt_id, self.seq, payload, self.snapshot_id)
+        if ts is None:
+            ts = time.time_ns()
+        pkts = build_packet(msg_type, self.pkt_id, self.seq, payload, self.snapshot_id, ts)
+        sendto, addr = self.sendto, self.server_addr
         for p in pkts:
             for i in range(repeat):
                 try:
-                    self.sock.sendto(p, self.server_addr)
+                    sendto(p, addr)
                 except Exception:
                     pass
             if ack:
                 # Save for potential retransmit
-                self.unacked_packets[self.seq] = {
-                    'packet': p,
-                    'last_sent': time.time_ns(),
-                    'msg_type': msg_type,
-                    'sent_count': 0
-                }
+                self.unacked_packets[self.seq] = UnackedPacket(p, ts, msg_type)
+                heapq.heappush(self.retransmit_heap, (ts + RETRANS_TIMEOUT_NS, self.seq))
             
             self.seq += 1
         self.pkt_id += 1
@@ -172,14 +191,14 @@ class ESPClientProtocol:
     # === Message Senders ===
     def send_init(self):
         log(f"[Client] Sending INIT")
-        self.send(MESSAGE_TYPES['INIT'])
+        self.send(MSG_INIT)
 
     def send_create_room(self, name):
         if not isinstance(name, str):
             return
         payload = build_create_room_payload(name)
         log(f"[Client] Creating room: {name}")
-        self.send(MESSAGE_TYPES['CREATE_ROOM'], payload)
+        self.send(MSG_CREATE_ROOM, payload)
 
     def send_join_room(self, room_id):
         if room_id < 1:
@@ -187,43 +206,50 @@ class ESPClientProtocol:
         
         payload = build_join_room_payload(room_id)
         log(f"[Client] Joining room {room_id}")
-        self.send(MESSAGE_TYPES['JOIN_ROOM'], payload)
+        self.send(MSG_JOIN_ROOM, payload)
         
     def send_leave_room(self):
         if self.room_id is None:
             return
         log(f"[Client] Leaving room {self.room_id}")
-        self.send(MESSAGE_TYPES['LEAVE_ROOM'])
+        self.send(MSG_LEAVE_ROOM)
 
     def send_list_rooms(self):
         log(f"[Client] Requesting room list")
-        self.send(MESSAGE_TYPES['LIST_ROOMS'])
+        self.send(MSG_LIST_ROOMS)
 
-    def request_cell(self, cell_idx):
+    def request_cell(self, cell_idx, now=None):
         """Request ownership of a cell (set to pending)."""
-        if cell_idx in self.pending_cells or self.grid[cell_idx] != 0:
-            return  # already pending or owned
+        if self.grid[cell_idx] or cell_idx in self.pending_cells:
+            return  # already owned or pending
 
-        payload = build_event_payload(EVENT_TYPES['CELL_ACQUISITION'], self.room_id, self.local_id, cell_idx)
-        self.pending_cells[cell_idx] = time.time_ns()
-        log(f"[Client] Cell {cell_idx} → PENDING (ownership requested)")
-        self.send(MESSAGE_TYPES['EVENT'], payload, False)
+        if now is None:
+            now = time.time_ns()
+        payload = build_event_payload(EVT_CELL_ACQUISITION, self.room_id, self.local_id, cell_idx)
+        self.pending_cells[cell_idx] = now
+        if debug_enabled():
+            log(f"[Client] Cell {cell_idx} → PENDING (ownership requested)")
+        self.send(MSG_EVENT, payload, False, ts=now)
         
-    def send_updates_ack(self, seq_num):
-        if seq_num < 1:
+    def send_updates_ack(self, seq_nums):
+        # every fragment of one UPDATES message is acknowledged in a single packet
+        seq_nums = [seq_num for seq_num in seq_nums if seq_num >= 1]
+        if not seq_nums:
             return
-        payload = build_updates_ack_payload(seq_num)
-        self.send(MESSAGE_TYPES['UPDATES_ACK'], payload, False)
+        payload = build_updates_ack_payload(seq_nums)
+        self.send(MSG_UPDATES_ACK, payload, False)
 
     def send_snapshot_ack(self, seq_num):
         if seq_num < 1:
             return
         payload = build_snapshot_ack_payload(seq_num)
-        self.send(MESSAGE_TYPES['SNAPSHOT_ACK'], payload, False)
+        self.send(MSG_SNAPSHOT_ACK, payload, False)
 
     def disconnect(self):
         log(f"[Client] Disconnecting...")
-        self.send(MESSAGE_TYPES['DISCONNECT'])
+        self.send(MSG_DISCONNECT)
+        if self.islogging:
+            self.metrics_logger.close()
             
         try:
             self.sock.close()
@@ -257,7 +283,11 @@ class ESPClientProtocol:
             if not self.ack_packet(seq):
                 return
             
-            # self.snapshot_id = 0 # reset snapshot_id when joining a room
+            if room_id != self.room_id:
+                # the new room numbers its snapshots from its own counter; a switch without a
+                # LEAVE_ACK (auto-join, lost ack) must not keep the old room's id
+                self.snapshot_id = 0
+                self.installed_snapshot_id = None
             self.room_id = room_id
             self.local_id = local_id
             
@@ -274,6 +304,9 @@ class ESPClientProtocol:
             self.room_id = None
             self.players = {}
             self.local_id = None
+            # the next room numbers its snapshots from its own counter
+            self.snapshot_id = 0
+            self.installed_snapshot_id = None
 
     def handle_list_rooms_ack(self, payload):
         res = parse_list_rooms_ack_payload(payload)
@@ -290,60 +323,67 @@ class ESPClientProtocol:
                 self.ui.update_room_list(rooms)
             """
             
+    @property
+    def owned_cells(self):
+        """Confirmed cells owned by this player, read from the grid (so snapshots are reflected too)."""
+        if not self.local_id:
+            return []
+        return [cell_idx for cell_idx, owner in enumerate(self.grid) if owner == self.local_id]
+
     def update_cell(self, event_type, player_local_id, cell_idx):
-        if cell_idx < 0 or cell_idx >= TOTAL_CELLS:
-            return
-        
-        if event_type == EVENT_TYPES['CELL_ACQUISITION']:
-            if cell_idx in self.pending_cells:
-                del self.pending_cells[cell_idx]
+        self.apply_cell_events(((event_type, player_local_id, cell_idx),))
+
+    def apply_cell_events(self, events):
+        """Apply (event_type, player_local_id, cell_idx) entries to the grid; only acquisitions change state."""
+        grid, pending, positions = self.grid, self.pending_cells, self.positions
+        local_id = self.local_id
+        trace = debug_enabled()
+        for event_type, player_local_id, cell_idx in events:
+            if event_type != EVT_CELL_ACQUISITION or cell_idx < 0 or cell_idx >= TOTAL_CELLS:
+                continue
             
+            pending.pop(cell_idx, None)
             if player_local_id == 0:
-                return
-                
-            if player_local_id == self.local_id:
-                self.owned_cells.add(cell_idx)
+                continue
             
-            self.grid[cell_idx] = player_local_id
-            x = cell_idx % GRID_N
-            y = cell_idx // GRID_N
-            self.positions[player_local_id] = (x, y)
-            owner = "you" if player_local_id == self.local_id else f"player {player_local_id}"
-            log(f"[Client] Cell {cell_idx} CONFIRMED for {owner}")
+            grid[cell_idx] = player_local_id
+            positions[player_local_id] = (cell_idx % GRID_N, cell_idx // GRID_N)
+            if trace:
+                owner = "you" if player_local_id == local_id else f"player {player_local_id}"
+                log(f"[Client] Cell {cell_idx} CONFIRMED for {owner}")
 
     def handle_event(self, pkt):
-        payload = pkt['payload']
+        payload = pkt.payload
         ev = parse_event_payload(payload)
         if not ev:
             return
         event_type, room_id, player_local_id, cell_idx = ev
         
         self.update_cell(event_type, player_local_id, cell_idx)
-        self.snapshot_id = pkt['snapshot_id']
+        self.snapshot_id = pkt.snapshot_id
 
     def handle_updates(self, pkt):
-        payload = pkt['payload']
+        payload = pkt.payload
         updates = parse_updates_payload(payload)
         if updates:
-            required_updates_count = pkt['snapshot_id'] - self.snapshot_id
+            required_updates_count = pkt.snapshot_id - self.snapshot_id
             if required_updates_count > 0 and required_updates_count <= len(updates):
-                for update in list(updates)[-required_updates_count:]:
-                    event_type, player_local_id, cell_idx = update
-                    self.update_cell(event_type, player_local_id, cell_idx)
+                self.apply_cell_events(islice(updates, len(updates) - required_updates_count, None))
                     
-                self.snapshot_id = pkt['snapshot_id']
-                for seq_key in pkt['seq_keys']: 
-                    log(f"[Client] Update #{self.snapshot_id} seq #{seq_key} received & ACKed")
+                self.snapshot_id = pkt.snapshot_id
+                if debug_enabled():
+                    for seq_key in pkt.seq_keys: 
+                        log(f"[Client] Update #{self.snapshot_id} seq #{seq_key} received & ACKed")
                 
-            for seq_key in pkt['seq_keys']:    
-                self.send_updates_ack(seq_key)
-                recv_time = time.time_ns()
+            self.send_updates_ack(pkt.seq_keys)
+            recv_time = time.time_ns()  # one receive stamp per message
+            for seq_key in pkt.seq_keys:    
                 if self.islogging:
                     self.metrics_logger.log_snapshot(
                         client_id=self.player_id,
-                        snapshot_id=pkt['snapshot_id'],
+                        snapshot_id=pkt.snapshot_id,
                         seq_num=seq_key,
-                        server_time=pkt['timestamp'],
+                        server_time=pkt.timestamp,
                         recv_time=recv_time,
                         positions=self.positions if self.positions else "",
                         bytes_received=self.bytes_received,
@@ -351,44 +391,65 @@ class ESPClientProtocol:
                     )
             
     def handle_snapshot(self, pkt):
-        payload = pkt['payload']
-        grid = parse_snapshot_payload(payload)
-        if grid:
-            self.grid = grid
-            self.snapshot_id = pkt['snapshot_id']
-            for seq_key in pkt['seq_keys']:    
+        snapshot_id = pkt.snapshot_id
+        # a retransmitted copy of the installed snapshot, or one older than the grid, is only re-ACKed;
+        # an id merely reached through events/updates is still installed in case one was missed
+        if snapshot_id < self.snapshot_id or snapshot_id == self.installed_snapshot_id:
+            for seq_key in pkt.seq_keys:
+                self.send_snapshot_ack(seq_key)
+            return
+
+        if parse_snapshot_payload(pkt.payload, self.grid) is not None:
+            self.snapshot_id = self.installed_snapshot_id = snapshot_id
+            trace = debug_enabled()
+            for seq_key in pkt.seq_keys:    
                 self.send_snapshot_ack(seq_key)
-                log(f"[Client] Snapshot #{self.snapshot_id} seq #{seq_key} received & ACKed")
+                if trace:
+                    log(f"[Client] Snapshot #{self.snapshot_id} seq #{seq_key} received & ACKed")
 
     # === Background retransmit task ===
     def retransmit(self):
+        # only entries whose deadline has passed are touched; the heap is ordered by deadline
         now = time.time_ns()
-        for seq, info in list(self.unacked_packets.items()):
-            if info['sent_count'] >= MAX_TRANSMISSION_RETRIES:
+        heap = self.retransmit_heap
+        trace = debug_enabled()
+        while heap and heap[0][0] < now:
+            _, seq = heapq.heappop(heap)
+            info = self.unacked_packets.get(seq)
+            if info is None:
+                continue  # acked since it was queued
+
+            if info.sent_count >= MAX_TRANSMISSION_RETRIES:
                 del self.unacked_packets[seq]
                 log(f"[Client] Dropping packet seq={seq} after {MAX_TRANSMISSION_RETRIES} retries (no ACK)")
                 continue
             
-            if now - info['last_sent'] > int(RETRANS_TIMEOUT * 1e9):
-                pkt_bytes = info['packet']
-                try:
-                    self.sock.sendto(pkt_bytes, self.server_addr)
-                except Exception:
-                    pass
-                info['last_sent'] = now
-                info['sent_count'] += 1
-                log(f"[Client] resent packet seq={seq} ({info['sent_count']}/{MAX_TRANSMISSION_RETRIES})")
-                    
+            try:
+                self.sendto(info.packet, self.server_addr)
+            except Exception:
+                pass
+            info.last_sent = now
+            info.sent_count += 1
+            heapq.heappush(heap, (now + RETRANS_TIMEOUT_NS, seq))
+            if trace:
+                log(f"[Client] resent packet seq={seq} ({info.sent_count}/{MAX_TRANSMISSION_RETRIES})")
 
-    # === Background pending timeout cleanup ===
-    def check_pending_cells(self):
+        self.check_pending_cells(now)
+
+    # === Pending timeout cleanup (run from the retransmit tick) ===
+    def check_pending_cells(self, now):
         """Remove or retry pending cells that never got confirmed."""
-        now = time.time_ns()
-        for cell_idx, t0 in list(self.pending_cells.items()):
-            if now - t0 > int(RETRANS_TIMEOUT * 1e9):
+        # requests are stamped in insertion order, so expiry stops at the first fresh entry;
+        # a retried cell is re-added at the back with a new stamp
+        pending = self.pending_cells
+        while pending:
+            cell_idx, t0 = next(iter(pending.items()))
+            if now - t0 <= RETRANS_TIMEOUT_NS:
+                break
+            pending.popitem(last=False)
+            if debug_enabled():
                 log(f"[Client] Cell {cell_idx} pending too long → retrying request")
-                del self.pending_cells[cell_idx]
-                self.request_cell(cell_idx)
+            self.request_cell(cell_idx, now)
     
     
     def test_behavior(self, test):
@@ -400,7 +461,7 @@ class ESPClientProtocol:
         
         # only attempt when in room and has a local_id
         if self.room_id and self.local_id:
-            cell = random.randint(0, TOTAL_CELLS - 1)
+            cell = random.randrange(TOTAL_CELLS)
             self.request_cell(cell)    
 
 if __name__ == "__main__":
@@ -410,12 +471,15 @@ if __name__ == "__main__":
     parser.add_argument("--test", type=int, help="Choose test sequence", required=False)
     parser.add_argument("--duration", type=int, help="Test duration in seconds", required=False)
     parser.add_argument("--log", type=str, help="Log file path", required=False)
+    parser.add_argument("--debug", action="store_true", help="Also log per-packet traces")
     args = parser.parse_args()
     
     islogging = False
     if args.log:
-        logging.basicConfig(filename=args.log, level=logging.INFO, format="%(asctime)s %(message)s")
+        logging.basicConfig(filename=args.log, level=logging.DEBUG if args.debug else logging.INFO, format="%(asctime)s %(message)s")
         islogging = True
+    elif args.debug:
+        logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(message)s")
     
     client = ESPClientProtocol(("127.0.0.1", 9999), metrices_id=args.metrics_id, islogging=islogging)
     if args.test is not None:
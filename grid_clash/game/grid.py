@@ -4,6 +4,7 @@ Game grid logic
 import pygame
 import sys
 import os
+from collections import Counter
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import *
 from ui.colors import Colors
@@ -13,11 +14,16 @@ class GameGrid:
         self.grid_size = grid_size
         self.cell_size = CELL_SIZE
         self.margin = MARGIN
-        self.grid = [0] * (grid_size * grid_size)  # 0 = empty, >0 = player_id
+        self.grid = bytearray(grid_size * grid_size)  # 0 = empty, >0 = player local id (fits a byte, as on the wire)
         self.scores = {}  # player_id -> score
+        # rendering cache: the grid is drawn once onto its own surface, then only changed cells are re-blitted
+        self.surface = None
+        self.drawn = None  # owners as last drawn onto self.surface
+        self.drawn_colors = None
+        self.cell_sprites = {}  # color -> pre-rendered cell
         
     def reset(self):
-        self.grid = [0] * (self.grid_size * self.grid_size)
+        self.grid = bytearray(self.grid_size * self.grid_size)
         self.scores.clear()
 
     def claim_cell(self, x, y, player_id):
@@ -39,10 +45,8 @@ class GameGrid:
         """Get the player with the highest score. Handle ties."""
 
         # recalculate score to avoid synchronization issues
-        scores = {}
-        for cell_owner in self.grid:
-            if cell_owner > 0:
-                scores[cell_owner] = scores.get(cell_owner, 0) + 1
+        scores = Counter(self.grid)
+        scores.pop(0, None)  # empty cells
 
         if not scores:
             return None, 0
@@ -58,25 +62,46 @@ class GameGrid:
             return winners[0], max_score
 
     def is_full(self):
-        return all(cell != 0 for cell in self.grid)
+        return 0 not in self.grid
+
+    def cell_sprite(self, color):
+        """Pre-rendered cell (fill + border) for a color, drawn once and reused."""
+        sprite = self.cell_sprites.get(color)
+        if sprite is None:
+            sprite = pygame.Surface((self.cell_size, self.cell_size)).convert()
+            sprite.fill(Colors.BACKGROUND)  # behind the rounded corners, so a blit fully replaces the old cell
+            cell_rect = sprite.get_rect()
+            pygame.draw.rect(sprite, color, cell_rect, border_radius=4)
+            pygame.draw.rect(sprite, Colors.GRID_BORDER, cell_rect, 1, border_radius=4)
+            self.cell_sprites[color] = sprite
+        return sprite
 
     def draw(self, surface, offset_x, offset_y, player_colors):
         """Draw the grid on the surface"""
-        for y in range(self.grid_size):
-            for x in range(self.grid_size):
-                index = y * self.grid_size + x
-                cell_rect = pygame.Rect(
-                    offset_x + x * (self.cell_size + self.margin),
-                    offset_y + y * (self.cell_size + self.margin),
-                    self.cell_size, self.cell_size
-                )
-                
-                # Cell color based on owner
-                owner_id = self.grid[index]
-                if owner_id == 0:
-                    color = Colors.GRID_EMPTY
-                else:
-                    color = player_colors.get(owner_id, Colors.GRID_EMPTY)
-                
-                pygame.draw.rect(surface, color, cell_rect, border_radius=4)
-                pygame.draw.rect(surface, Colors.GRID_BORDER, cell_rect, 1, border_radius=4)
\ No newline at end of file
+        n = self.grid_size * self.grid_size
+        if self.surface is None or player_colors != self.drawn_colors or len(self.drawn) != n:
+            # first frame or a player color changed: redraw every cell
+            step = self.cell_size + self.margin
+            self.surface = pygame.Surface((self.grid_size * step, self.grid_size * step)).convert()
+            self.surface.fill(Colors.BACKGROUND)
+            self.drawn = bytearray(n)
+            self.drawn_colors = dict(player_colors)
+            changed = range(n)
+        elif self.grid == self.drawn:
+            changed = ()
+        else:
+            drawn = self.drawn
+            changed = [index for index, owner in enumerate(self.grid) if owner != drawn[index]]
+
+        for index in changed:
+            y, x = divmod(index, self.grid_size)
+            # Cell color based on owner
+            owner_id = self.grid[index]
+            if owner_id == 0:
+                color = Colors.GRID_EMPTY
+            else:
+                color = player_colors.get(owner_id, Colors.GRID_EMPTY)
+            self.surface.blit(self.cell_sprite(color), (x * (self.cell_size + self.margin), y * (self.cell_size + self.margin)))
+            self.drawn[index] = owner_id
+
+        surface.blit(self.surface, (offset_x, offset_y))
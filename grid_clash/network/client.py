@@ -18,7 +18,7 @@ class GridClashNetworkClient:
         self.room_list = []
         self.current_room = None
         self.players = {}
-        self.grid = [0] * TOTAL_CELLS
+        self.grid = bytearray(TOTAL_CELLS)
         
         # Callbacks for UI updates
         self.on_room_list_update: Optional[Callable] = None
@@ -158,7 +158,7 @@ class GridClashNetworkClient:
         
     def get_grid_state(self):
         """Get current grid state"""
-        return self.grid.copy() if hasattr(self, 'grid') else [0] * 400
+        return self.grid.copy() if hasattr(self, 'grid') else bytearray(TOTAL_CELLS)
         
     def get_room_players(self):
         """Get players in current room"""
@@ -4,6 +4,7 @@ UI Screens for different game states
 import pygame
 import os
 import sys
+from collections import Counter
 
 # Add the parent directory to the path so we can import from config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -293,7 +294,7 @@ class GameScreen(Screen):
         ]
     
     def is_grid_full(self, grid):
-        return all(cell != 0 for cell in grid)
+        return 0 not in grid
         
     def draw(self, surface):
         surface.fill(Colors.BACKGROUND)
@@ -325,10 +326,7 @@ class GameScreen(Screen):
         
         # Player scores (calculate from grid)
         start_y = 100
-        scores = {}
-        for cell_owner in self.grid.grid:
-            if cell_owner > 0:
-                scores[cell_owner] = scores.get(cell_owner, 0) + 1
+        scores = Counter(self.grid.grid)  # owner -> cells, counted in C; key 0 (empty) is never looked up
         
         # Get player info from network
         player_info = self.game.network_client.get_player_info()
@@ -8,6 +8,10 @@ class ESPServerProtocol:
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((host, port))
         self.sock.setblocking(False)
+        rcvbuf, sndbuf = tune_socket_buffers(self.sock)
+        log(f"[SERVER] Socket buffers: rcv={rcvbuf} snd={sndbuf} bytes")
+        self.recv_buf = bytearray(RECV_BUFSIZE)
+        self.recv_view = memoryview(self.recv_buf)
         self.fragment_manager = FragmentManager()
         self.islogging = islogging
         if self.islogging:
@@ -21,6 +25,18 @@ class ESPServerProtocol:
             "fragment_cleanup": {"interval": 1.0, "last": 0.0, "func": self.fragment_manager.cleanup},
         }        
         
+        self.handlers = {  # msg_type -> handler(pkt, addr)
+            MSG_INIT: self.handle_init,
+            MSG_CREATE_ROOM: self.handle_create_room,
+            MSG_JOIN_ROOM: self.handle_join_room,
+            MSG_LEAVE_ROOM: self.handle_leave_room,
+            MSG_LIST_ROOMS: self.handle_list_rooms,
+            MSG_EVENT: self.handle_event,
+            MSG_UPDATES_ACK: self.handle_updates_ack,
+            MSG_SNAPSHOT_ACK: self.handle_snapshot_ack,
+            MSG_DISCONNECT: self.handle_disconnect,
+        }
+        
         self.next_player_id = 1
         self.players: Dict[int, PlayerRoomInfo] = {}  # player_id -> PlayerRoomInfo
         self.addr_to_player: Dict[Tuple[str, int], int] = {}  # addr -> player_id
@@ -31,7 +47,8 @@ class ESPServerProtocol:
         
         self.pkt_id = 1
         self.seq: Dict[int, int] = {} 
-        self.unacked_packets = {}  # (seq, player_id) -> {'packet': bytes, 'last_sent': time.time_ns(), 'msg_type': int, 'sent_count':int}
+        self.unacked_packets = {}  # (seq, player_id) -> UnackedPacket
+        self.expired_keys = []  # scratch list reused by retransmit
 
     # Datagram Protocol Methods
     def run(self, duration=None):
@@ -41,6 +58,8 @@ class ESPServerProtocol:
             while True:
                 if duration and (time.time() - start) >= duration:
                     log("[SERVER] Test duration ended, server stopped")
+                    if self.islogging:
+                        self.metrics_logger.close()
                     try:
                         self.sock.close()
                     except Exception:
@@ -64,6 +83,8 @@ class ESPServerProtocol:
                 
         except KeyboardInterrupt:
             log("[SERVER] Stopping by user (Ctrl+C).")
+            if self.islogging:
+                self.metrics_logger.close()
             try:
                 self.sock.close()
             except Exception:
@@ -71,55 +92,41 @@ class ESPServerProtocol:
             sys.exit(0)
         
     def handle_recv(self):
-        while True:
+        now = time.monotonic()  # one clock sample per wake for fragment bookkeeping
+        for _ in range(SERVER_RECV_BATCH):  # bounded drain per wake; select re-arms for the rest
             try:
-                data, addr = self.sock.recvfrom(65536)
+                nbytes, addr = self.sock.recvfrom_into(self.recv_buf)
             except BlockingIOError:
                 return
             except Exception as e:
                 log("[SERVER] recv error:", e)
                 return
-            
-            pkt = parse_packet(data)
-            if pkt is None:
-                continue
+            if nbytes > MAX_PACKET:
+                continue  # larger than any packet we build
+            self.handle_datagram(self.recv_view[:nbytes], addr, now)
 
-            frag_result = self.fragment_manager.add_fragment(addr, pkt['pkt_id'], pkt['seq'], pkt['payload_len'], pkt['payload'])
-            if frag_result is None:
-                continue # waiting for more fragments
-            
-            (seq_keys, payload) = frag_result
-            pkt['payload'] = payload
-            pkt['seq_keys'] = seq_keys
-            
-            t = pkt['msg_type']
-            if t == MESSAGE_TYPES['INIT']:
-                self.handle_init(pkt, addr)
-            elif t == MESSAGE_TYPES['CREATE_ROOM']:
-                self.handle_create_room(pkt, addr)
-            elif t == MESSAGE_TYPES['JOIN_ROOM']:
-                self.handle_join_room(pkt, addr)
-            elif t == MESSAGE_TYPES['LEAVE_ROOM']:
-                self.handle_leave_room(pkt, addr)
-            elif t == MESSAGE_TYPES['LIST_ROOMS']:
-                self.handle_list_rooms(pkt, addr)
-            elif t == MESSAGE_TYPES['EVENT']:
-                self.handle_event(pkt, addr)
-            elif t == MESSAGE_TYPES['UPDATES_ACK']:
-                self.handle_updates_ack(pkt, addr)
-            elif t == MESSAGE_TYPES['SNAPSHOT_ACK']:
-                self.handle_snapshot_ack(pkt, addr)
-            elif t == MESSAGE_TYPES['DISCONNECT']:
-                self.handle_disconnect(pkt, addr)
-            else:
-                # ignore clients won't send INIT_ACK, CREATE_ACK, JOIN_ACK, LIST_ROOMS_ACK, SNAPSHOT or unknown message type
-                pass
-            
-            if pkt['seq'] not in self.seen_seq.get(addr, set()):
-                self.seen_seq.setdefault(addr, set()).add(pkt['seq'])
+    def handle_datagram(self, data, addr, now):
+        pkt = parse_packet(data)
+        if pkt is None:
+            return
+
+        frag_result = self.fragment_manager.add_fragment(addr, pkt.pkt_id, pkt.seq, pkt.payload_len, pkt.payload, now)
+        if frag_result is None:
+            return # waiting for more fragments
+        
+        (seq_keys, payload) = frag_result
+        pkt = pkt._replace(payload=payload, seq_keys=seq_keys)
+        
+        # clients won't send INIT_ACK, CREATE_ACK, JOIN_ACK, LIST_ROOMS_ACK or SNAPSHOT; those and unknown types are ignored
+        handler = self.handlers.get(pkt.msg_type)
+        if handler is not None:
+            handler(pkt, addr)
+        
+        if pkt.seq not in self.seen_seq.get(addr, set()):
+            self.seen_seq.setdefault(addr, set()).add(pkt.seq)
                     
     # === Send helpers ===
-    def send(self, msg_type, address, payload=b'', ack=False, repeat=1):
+    def send(self, msg_type, address, payload=b'', ack=False, repeat=1, ts=None):
         if ack:
             repeat = 1
             
@@ -137,7 +144,13 @@ class ESPServerProtocol:
         snapshot_id = 0
         if self.players.get(player_id) is not None and self.rooms.get(self.players.get(player_id).room_id) is not None:
             snapshot_id = self.rooms.get(self.players.get(player_id).room_id).snapshot_id
-        pkts = build_packet(msg_type, self.pkt_id, self.seq[player_id], payload, snapshot_id)
+        if ts is None:
+            ts = time.time_ns()
+        if msg_type == MSG_SNAPSHOT:
+            # snapshot payload is the room grid itself, written straight into the packets
+            pkts = build_snapshot_packets(self.pkt_id, self.seq[player_id], payload, snapshot_id, ts)
+        else:
+            pkts = build_packet(msg_type, self.pkt_id, self.seq[player_id], payload, snapshot_id, ts)
 
         for p in pkts:
             for i in range(repeat):
@@ -147,20 +160,15 @@ class ESPServerProtocol:
                     pass
             if ack:
                 # Save for potential retransmit
-                self.unacked_packets[(self.seq[player_id], player_id)] = {
-                    'packet': p,
-                    'last_sent': time.time_ns(),
-                    'msg_type': msg_type,
-                    'sent_count': 0
-                }
+                self.unacked_packets[(self.seq[player_id], player_id)] = UnackedPacket(p, ts, msg_type)
             
-            if msg_type == MESSAGE_TYPES['UPDATES']:
+            if msg_type == MSG_UPDATES:
                 if self.islogging:
                     self.metrics_logger.log_snapshot(
                         client_id=player_id,
                         snapshot_id=snapshot_id,
                         seq_num=self.seq[player_id],
-                        server_time=parse_packet(p)['timestamp'],
+                        server_time=ts,
                         positions=self.rooms_positions.get(self.players.get(player_id).room_id, ""),
                     )
                 
@@ -188,13 +196,13 @@ class ESPServerProtocol:
         
         player_id = self.addr_to_player[addr]
 
-        for seq_key in pkt['seq_keys']:
+        for seq_key in pkt.seq_keys:
             payload = build_init_ack_payload(seq_key, player_id)
-            if not self.send(MESSAGE_TYPES['INIT_ACK'], addr, payload):
+            if not self.send(MSG_INIT_ACK, addr, payload):
                 return
           
     def handle_create_room(self, pkt, addr):
-        room_name = parse_create_room_payload(pkt['payload'])
+        room_name = parse_create_room_payload(pkt.payload)
         if room_name is None:
             return
         
@@ -211,13 +219,13 @@ class ESPServerProtocol:
             self.next_room_id += 1
             self.pkt_id += 1
             
-        for seq_key in pkt['seq_keys']:
+        for seq_key in pkt.seq_keys:
             payload = build_create_ack_payload(seq_key, room_id)
-            if not self.send(MESSAGE_TYPES['CREATE_ACK'], addr, payload):
+            if not self.send(MSG_CREATE_ACK, addr, payload):
                 return
                 
     def handle_join_room(self, pkt, addr):
-        room_id = parse_join_room_payload(pkt['payload'])
+        room_id = parse_join_room_payload(pkt.payload)
         if room_id is None:
             return
         
@@ -237,9 +245,9 @@ class ESPServerProtocol:
         in_room = self.players.get(player_id).room_id == room_id
         if in_room:
             players = {lid: (p.global_id, p.color) for lid, p in room.players.items()}
-            for seq_key in pkt['seq_keys']:
+            for seq_key in pkt.seq_keys:
                 payload = build_join_ack_payload(seq_key, room_id, self.players[player_id].player_local_id, players)
-                if not self.send(MESSAGE_TYPES['JOIN_ACK'], addr, payload, False, REDUNDANT_K_PACKETS):
+                if not self.send(MSG_JOIN_ACK, addr, payload, False, REDUNDANT_K_PACKETS):
                     break
                 log(f"[SERVER] Sent join ack for player {player_id} as local id {self.players[player_id].player_local_id}")
             return
@@ -269,13 +277,13 @@ class ESPServerProtocol:
                 continue
             
             address = player_info.address
-            seq_keys = [pkt['seq_keys'][0]]
+            seq_keys = pkt.seq_keys[:1]
             if ld == local_id:
-                seq_keys = pkt['seq_keys']
+                seq_keys = pkt.seq_keys
                 
             for seq_key in seq_keys:
                 payload = build_join_ack_payload(seq_key, room_id, ld, players)
-                if not self.send(MESSAGE_TYPES['JOIN_ACK'], address, payload, False, REDUNDANT_K_PACKETS):
+                if not self.send(MSG_JOIN_ACK, address, payload, False, REDUNDANT_K_PACKETS):
                     break
                 log(f"[SERVER] Sent join ack for player {player.global_id} as local id {ld}")
                 sent = True
@@ -285,8 +293,7 @@ class ESPServerProtocol:
             # rejoining player has to get a snasphot
             player_info = self.players.get(player_id)
             if player_info:
-                payload = build_snapshot_payload(room.grid)
-                self.send(MESSAGE_TYPES['SNAPSHOT'], player_info.address, payload=payload, ack=True)
+                self.send(MSG_SNAPSHOT, player_info.address, payload=room.grid, ack=True)
             self.pkt_id += 1
     
     def handle_leave_room(self, pkt, addr):
@@ -311,9 +318,9 @@ class ESPServerProtocol:
         
         if not in_room:
             players = {lid: (p.global_id, p.color) for lid, p in room.players.items()}
-            for seq_key in pkt['seq_keys']:
+            for seq_key in pkt.seq_keys:
                 payload = build_leave_ack_payload(seq_key, players)
-                if not self.send(MESSAGE_TYPES['LEAVE_ACK'], addr, payload, False, REDUNDANT_K_PACKETS):
+                if not self.send(MSG_LEAVE_ACK, addr, payload, False, REDUNDANT_K_PACKETS):
                     break
             return
         
@@ -324,10 +331,8 @@ class ESPServerProtocol:
         self.players[player_id].room_id = 0
         self.players[player_id].player_local_id = 0
 
-        # remove grid cells of leaving player
-        for i in range(len(room.grid)):
-            if room.grid[i] == local_id:
-                room.grid[i] = 0  # Free the cell
+        # remove grid cells of leaving player (free every byte owned by local_id in one pass)
+        room.grid[:] = room.grid.replace(bytes((local_id,)), b'\x00')
                 
         if room_id in self.rooms_positions and local_id in self.rooms_positions[room_id]:
             del self.rooms_positions[room_id][local_id]
@@ -341,11 +346,10 @@ class ESPServerProtocol:
         room.snapshot_id += 1
 
         # send clearance snapshot
-        snapshot_payload = build_snapshot_payload(room.grid)
         for player in room.players.values():
             player_info = self.players.get(player.global_id)
             if player_info:
-                self.send(MESSAGE_TYPES['SNAPSHOT'], player_info.address, payload=snapshot_payload, ack=True)
+                self.send(MSG_SNAPSHOT, player_info.address, payload=room.grid, ack=True)
 
         # gotta check if the room is empty or not so we can remove it later
         room_empty = len(room.players) == 0
@@ -358,13 +362,13 @@ class ESPServerProtocol:
                 continue
             
             address = player_info.address
-            seq_keys = [pkt['seq_keys'][0]]
+            seq_keys = pkt.seq_keys[:1]
             if ld == local_id:
-                seq_keys = pkt['seq_keys']
+                seq_keys = pkt.seq_keys
     
             for seq_key in seq_keys:
                 payload = build_leave_ack_payload(seq_key, players)
-                if not self.send(MESSAGE_TYPES['LEAVE_ACK'], address, payload, False, REDUNDANT_K_PACKETS):
+                if not self.send(MSG_LEAVE_ACK, address, payload, False, REDUNDANT_K_PACKETS):
                     break
                 sent = True
         
@@ -384,9 +388,9 @@ class ESPServerProtocol:
         
         rooms_info = {room_id: (len(room.players), room.name) for room_id, room in self.rooms.items()}
         
-        for seq_key in pkt['seq_keys']:
+        for seq_key in pkt.seq_keys:
             payload = build_list_rooms_ack_payload(seq_key, rooms_info)
-            if not self.send(MESSAGE_TYPES['LIST_ROOMS_ACK'], addr, payload):
+            if not self.send(MSG_LIST_ROOMS_ACK, addr, payload):
                 return
         
         log(f"[SERVER] Sent room list to {addr}")
@@ -397,7 +401,7 @@ class ESPServerProtocol:
         if player_id is None:
             return
         
-        ev = parse_event_payload(pkt['payload'])
+        ev = parse_event_payload(pkt.payload)
         if ev is None:
             return
         event_type, room_id, player_local_id, cell_idx = ev
@@ -417,19 +421,19 @@ class ESPServerProtocol:
             
             address = player_info.address
             payload = build_event_payload(event_type, room_id, 0, cell_idx)
-            if not self.send(MESSAGE_TYPES['EVENT'], address, payload, False, REDUNDANT_K_PACKETS):
+            if not self.send(MSG_EVENT, address, payload, False, REDUNDANT_K_PACKETS):
                 return
             
             log(f"[SERVER] Sent Ignore Event (players < required number of room players) to {address}")
         else:
-            check_duplicates = any(seq for seq in pkt['seq_keys'] if seq in self.seen_seq.get(addr, set()))
+            check_duplicates = any(seq for seq in pkt.seq_keys if seq in self.seen_seq.get(addr, set()))
             if check_duplicates:
                 player_info = self.players.get(player_id) 
                 if player_info is None:
                     return
                 
                 address = player_info.address
-                if not self.send(MESSAGE_TYPES['EVENT'], address, pkt['payload'], False, REDUNDANT_K_PACKETS):
+                if not self.send(MSG_EVENT, address, pkt.payload, False, REDUNDANT_K_PACKETS):
                     return
                 
                 log(f"[SERVER] Sent Event (Type: {event_type}, Room (ID:{room.room_id}, Name: {room.name}), Player local id:{player_local_id}, Cell index:{cell_idx}) to {address}")
@@ -442,7 +446,7 @@ class ESPServerProtocol:
                     continue
                 
                 address = player_info.address
-                if not self.send(MESSAGE_TYPES['EVENT'], address, pkt['payload'], False, REDUNDANT_K_PACKETS):
+                if not self.send(MSG_EVENT, address, pkt.payload, False, REDUNDANT_K_PACKETS):
                     continue
                 sent = True
                 log(f"[SERVER] Sent Event (Type: {event_type}, Room (ID:{room.room_id}, Name: {room.name}), Player local id:{player_local_id}, Cell index:{cell_idx}) to {address}")
@@ -454,7 +458,7 @@ class ESPServerProtocol:
         if not (0 <= cell_idx < TOTAL_CELLS):
             return
         
-        if event_type == EVENT_TYPES['CELL_ACQUISITION']:
+        if event_type == EVT_CELL_ACQUISITION:
             if room.grid[cell_idx] != 0:
                 return
             room.grid[cell_idx] = player_local_id
@@ -476,14 +480,19 @@ class ESPServerProtocol:
         if self.players.get(player_id) is None or self.rooms.get(self.players.get(player_id).room_id) is None:
             return
         
-        seq = parse_updates_ack_payload(pkt["payload"])
-        if not seq:
+        seqs = parse_updates_ack_payload(pkt.payload)
+        if not seqs:
             return
         
+        for seq in seqs:
+            if seq:
+                self.ack_updates_seq(seq, player_id, addr)
+
+    def ack_updates_seq(self, seq, player_id, addr):
         key = (seq, player_id)
         
         if key in self.unacked_packets:
-            pkt = parse_packet(self.unacked_packets[key]['packet'])
+            pkt = parse_packet(self.unacked_packets[key].packet)
             if pkt is None:
                 return
         
@@ -491,13 +500,12 @@ class ESPServerProtocol:
             return 
         
         room = self.rooms.get(self.players.get(player_id).room_id)
-        required_updates_count = room.snapshot_id - pkt['snapshot_id']
+        required_updates_count = room.snapshot_id - pkt.snapshot_id
         if required_updates_count > LAST_K_UPDATES:
-            payload = build_snapshot_payload(room.grid)
-            self.send(MESSAGE_TYPES['SNAPSHOT'], addr, payload=payload, ack = True)
+            self.send(MSG_SNAPSHOT, addr, payload=room.grid, ack = True)
         elif required_updates_count > 0:
-            payload = build_updates_payload(list(room.updates)[-required_updates_count:])
-            self.send(MESSAGE_TYPES['UPDATES'], addr, payload=payload, ack = True)
+            payload = build_updates_payload(room.updates, required_updates_count)
+            self.send(MSG_UPDATES, addr, payload=payload, ack = True)
 
     def handle_snapshot_ack(self, pkt, addr):
         # find player_id for addr
@@ -508,15 +516,15 @@ class ESPServerProtocol:
         if self.players.get(player_id) is None or self.rooms.get(self.players.get(player_id).room_id) is None:
             return
         
-        seq = parse_snapshot_ack_payload(pkt["payload"])
+        seq = parse_snapshot_ack_payload(pkt.payload)
         if not seq:
             return
         
-        seq = pkt['seq']
+        seq = pkt.seq
         key = (seq, player_id)
         
         if key in self.unacked_packets:
-            pkt = parse_packet(self.unacked_packets[key]['packet'])
+            pkt = parse_packet(self.unacked_packets[key].packet)
             if pkt is None:
                 return
              
@@ -525,9 +533,8 @@ class ESPServerProtocol:
         
         room = self.rooms.get(self.players.get(player_id).room_id)
         snapshot_id = room.snapshot_id
-        if pkt['snapshot_id'] < snapshot_id:
-            payload = build_snapshot_payload(room.grid)
-            self.send(MESSAGE_TYPES['SNAPSHOT'], addr, payload=payload, ack = True)
+        if pkt.snapshot_id < snapshot_id:
+            self.send(MSG_SNAPSHOT, addr, payload=room.grid, ack = True)
 
     def handle_disconnect(self, pkt, addr):
         player_id = self.addr_to_player.get(addr)
@@ -538,8 +545,10 @@ class ESPServerProtocol:
     # Helper Methods
     def send_updates_to_all(self):
         sent = False
+        ts = time.time_ns()  # one timestamp for the whole broadcast tick
+        trace = debug_enabled()
         for room in self.rooms.values():
-            payload = build_updates_payload(list(room.updates)[-REDUNDANT_K_UPDATES:])
+            payload = build_updates_payload(room.updates, REDUNDANT_K_UPDATES)
             if len(room.players) < REQUIRED_ROOM_PLAYERS:
                 continue
             for player in room.players.values():
@@ -547,9 +556,10 @@ class ESPServerProtocol:
                 if seq is None:
                     continue
                 
-                if not self.send(MESSAGE_TYPES['UPDATES'], self.players[player.global_id].address, payload=payload, ack = True):
+                if not self.send(MSG_UPDATES, self.players[player.global_id].address, payload=payload, ack = True, ts=ts):
                     continue                
-                log(f"[SERVER] Updates Sent Player ID:{player.global_id}, Seq_num:{self.seq[player.global_id]}")
+                if trace:
+                    log(f"[SERVER] Updates Sent Player ID:{player.global_id}, Seq_num:{self.seq[player.global_id]}")
                 sent = True
                 
         if sent:
@@ -574,7 +584,7 @@ class ESPServerProtocol:
         self.addr_to_player.pop(addr, None)
 
         # --- 3. Clear network-related state ---
-        self.fragment_manager.fragments = {k: v for k, v in self.fragment_manager.fragments.items() if k[0] != player_id}
+        self.fragment_manager.fragments = OrderedDict((k, v) for k, v in self.fragment_manager.fragments.items() if k[0] != player_id)
 
         # --- 4. Remove player object ---
         del self.players[player_id]
@@ -583,30 +593,34 @@ class ESPServerProtocol:
 
     def retransmit(self):
         now = time.time_ns()
-        for (seq, player_id), entry in list(self.unacked_packets.items()):
-            if entry['sent_count'] >= MAX_TRANSMISSION_RETRIES:
-                del self.unacked_packets[(seq, player_id)]
+        expired = self.expired_keys  # reused; keys to drop once the iteration is done
+        expired.clear()
+        for (seq, player_id), entry in self.unacked_packets.items():
+            if entry.sent_count >= MAX_TRANSMISSION_RETRIES:
+                expired.append((seq, player_id))
                 continue
 
-            if now - entry['last_sent'] > int(RETRANS_TIMEOUT * 1e9):
+            if now - entry.last_sent > RETRANS_TIMEOUT_NS:
                 # Skip if player disconnected
                 player = self.players.get(player_id)
                 if not player:
                     # Optionally log or silently ignore
                     log(f"[SERVER] Retransmit skipped: player {player_id} disconnected")
-                    del self.unacked_packets[(seq, player_id)]
+                    expired.append((seq, player_id))
                     continue
 
-                pkt_bytes = entry['packet']
+                pkt_bytes = entry.packet
                 addr = player.address
                 try:
                     self.sock.sendto(pkt_bytes, addr)
                 except Exception as e:
                     log(f"[SERVER] Retransmit failed for player {player_id}: {e}")
 
-                entry['last_sent'] = now
-                entry['sent_count'] += 1
+                entry.last_sent = now
+                entry.sent_count += 1
 
+        for key in expired:
+            del self.unacked_packets[key]
 
             
 if __name__ == "__main__":
@@ -614,11 +628,14 @@ if __name__ == "__main__":
     parser.add_argument("--rate", type=float, default=20.0, help="Snapshot rate (Hz)")
     parser.add_argument("--duration", type=int, help="Run duration (seconds). Omit for continuous run.")
     parser.add_argument("--log", type=str, help="Log file path", required=False)
+    parser.add_argument("--debug", action="store_true", help="Also log per-packet traces")
     args = parser.parse_args()
     islogging = False
     if args.log:
-        logging.basicConfig(filename=args.log, level=logging.INFO, format="%(asctime)s %(message)s")
+        logging.basicConfig(filename=args.log, level=logging.DEBUG if args.debug else logging.INFO, format="%(asctime)s %(message)s")
         islogging = True
+    elif args.debug:
+        logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(message)s")
 
     server = ESPServerProtocol(islogging=islogging)
     server.run(args.duration)